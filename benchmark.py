@@ -0,0 +1,438 @@
+"""Local benchmarks for the scrapers. Only `record` talks to the live sites.
+
+    python benchmark.py scroll --items 200
+    python benchmark.py parse --kind ff-product saved/ff/products/*.html
+    python benchmark.py json output/chocolate_products.json output/foreignfortune.json
+    python benchmark.py records --copies 50 output/chocolate_products.json output/foreignfortune.json
+    python benchmark.py record --out fixtures/sites.jsonl.gz --sites foreignfortune lechocolat traderjoes
+    python benchmark.py offline --fixtures fixtures/sites.jsonl.gz --latency 80 --jitter 40 --error-rate 0.01 \\
+        --save bench/current.json --baseline bench/main.json
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import glob
+import json
+import multiprocessing
+import re
+import resource
+import statistics
+import time
+import tracemalloc
+from aiohttp import web
+from parsel import Selector
+
+from traderjoes import TraderJoesScraper
+from foreignfortune import ForeignFortuneScraper
+from lechocolat import ChocolateScraper
+from fixtures import FixtureArchive, BrowserReplay, rewrite_to, serve_replay
+from metrics import METRICS, Histogram
+import jsonlib
+from records import Product, decode_products
+from extraction import WEB_PIXELS_SCRIPT, TJ_LIST_ITEMS, TJ_ITEM_URL, TJ_ITEM_IMAGE, TJ_ITEM_PRICE, first
+
+# Lazy-loading listing: a new batch of items is appended whenever the user
+# gets near the bottom, like the Trader Joe's product list.
+SCROLL_FIXTURE = '''<!DOCTYPE html>
+<html><head><style>li {{ height: 120px; }}</style></head>
+<body>
+<ul class="ProductList_productList__list__3-dGs"></ul>
+<script>
+    const total = {total};
+    const batch = {batch};
+    const list = document.querySelector('ul');
+    let loading = false;
+    function load() {{
+        if (loading || list.children.length >= total) return;
+        loading = true;
+        setTimeout(() => {{
+            for (let i = 0; i < batch && list.children.length < total; i++) {{
+                const li = document.createElement('li');
+                li.textContent = 'item ' + list.children.length;
+                list.appendChild(li);
+            }}
+            loading = false;
+        }}, {delay});
+    }}
+    window.addEventListener('scroll', () => {{
+        if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 200) load();
+    }});
+    load();
+</script>
+</body></html>'''
+
+
+async def serve(app: web.Application, port: int = 0):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def bench_scroll(args):
+    html = SCROLL_FIXTURE.format(total=args.items, batch=args.batch, delay=args.delay)
+    app = web.Application()
+    app.router.add_get('/', lambda request: web.Response(text=html, content_type='text/html'))
+    runner, base = await serve(app)
+
+    scraper = TraderJoesScraper(pool_size=1)
+    await scraper.init_browser()
+    try:
+        for strategy in ("poll", "observer"):
+            scraper.scroll_strategy = strategy
+            timings = []
+            for _ in range(args.repeat):
+                await scraper.page.goto(base, {'waitUntil': 'load'})
+                await scraper.page.waitForSelector('ul > li')
+                start = time.perf_counter()
+                await scraper.settle_list()
+                timings.append(time.perf_counter() - start)
+                count = await scraper.page.evaluate("() => document.querySelector('ul').children.length")
+            best = min(timings)
+            print(f"{strategy:>9}: best {best:.2f}s, mean {sum(timings) / len(timings):.2f}s, items {count}/{args.items}")
+    finally:
+        await scraper.close_browser()
+        await runner.cleanup()
+
+
+# The extraction code as it was before extraction.py, kept as the baseline.
+def legacy_ff_collection(html):
+    text = Selector(text=html).xpath("//script[@id='web-pixels-manager-setup']/text()").get()
+    match = re.search(r'publish\("collection_viewed",\s*(.*?)\s*\);}', text, re.DOTALL)
+    return json.loads(match.group(1))["collection"]["productVariants"]
+
+
+def legacy_ff_product(html):
+    text = Selector(text=html).xpath("//script[@id='web-pixels-manager-setup']/text()").get()
+    match = re.search(r'isMerchantRequest: false,initData:\s*(.*?)\s*,\},function pageEvents', text, re.DOTALL)
+    return ForeignFortuneScraper().extract_models(match.group(1))
+
+
+def legacy_tj_listing(html):
+    cards = []
+    for element in Selector(text=html).xpath("//ul[@class='ProductList_productList__list__3-dGs']/li").getall():
+        sel = Selector(text=element)
+        cards.append((
+            sel.xpath("//section/a/@href").get(),
+            sel.xpath("//section/a/div//source/@srcset").get(),
+            sel.xpath("//section/div/div[@class='ProductPrice_productPrice__1Rq1r ProductCard_card__productPrice__1W4Le']/div/span[@class='ProductPrice_productPrice__price__3-50j']/text()").get(),
+        ))
+    return cards
+
+
+def current_ff_collection(scraper):
+    def run(html):
+        text = first(WEB_PIXELS_SCRIPT, Selector(text=html).root)
+        return scraper.extract_json_data(text)["collection"]["productVariants"]
+    return run
+
+
+def current_ff_product(scraper):
+    def run(html):
+        text = first(WEB_PIXELS_SCRIPT, Selector(text=html).root)
+        return scraper.extract_models(scraper.extract_prod_json(text))
+    return run
+
+
+def current_tj_listing(html):
+    return [
+        (first(TJ_ITEM_URL, li), first(TJ_ITEM_IMAGE, li), first(TJ_ITEM_PRICE, li))
+        for li in TJ_LIST_ITEMS(Selector(text=html).root)
+    ]
+
+
+def time_parser(parse, pages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html in pages:
+            parse(html)
+        best = min(best, time.perf_counter() - start)
+    return best / len(pages)
+
+
+async def bench_parse(args):
+    paths = [p for pattern in args.pages for p in glob.glob(pattern)]
+    if not paths:
+        raise SystemExit("no saved pages matched")
+    pages = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            pages.append(f.read())
+
+    if args.kind == "tj-listing":
+        variants = {"before": legacy_tj_listing, "after": current_tj_listing}
+    else:
+        legacy = legacy_ff_collection if args.kind == "ff-collection" else legacy_ff_product
+        current = current_ff_collection if args.kind == "ff-collection" else current_ff_product
+        variants = {
+            "before": legacy,
+            "after (regex)": current(ForeignFortuneScraper(json_scanner=False)),
+            "after (scanner)": current(ForeignFortuneScraper(json_scanner=True)),
+        }
+
+    baseline = None
+    for name, parse in variants.items():
+        per_page = time_parser(parse, pages, args.repeat)
+        baseline = baseline or per_page
+        print(f"{name:>16}: {per_page * 1000:.3f} ms/page ({baseline / per_page:.2f}x)")
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def bench_json(args):
+    backends = ["json"] + [b for b in ("orjson", "msgspec") if getattr(jsonlib, b) is not None]
+    for path in args.files:
+        with open(path, "rb") as f:
+            raw = f.read()
+        data = jsonlib.loads(raw, backend="json")
+        print(f"{path} ({len(raw) / 1024:.0f} KB, {len(data)} products)")
+        baseline = {}
+        for backend in backends:
+            timings = {
+                "decode": best_of(lambda: jsonlib.loads(raw, backend=backend), args.repeat),
+                "encode": best_of(lambda: jsonlib.dumps_bytes(data, backend=backend), args.repeat),
+                "encode indent": best_of(lambda: jsonlib.dumps_bytes(data, indent=2, backend=backend), args.repeat),
+            }
+            cells = []
+            for name, seconds in timings.items():
+                baseline.setdefault(name, seconds)
+                cells.append(f"{name} {seconds * 1000:7.2f} ms ({baseline[name] / seconds:4.1f}x)")
+            print(f"  {backend:>8}: " + ", ".join(cells))
+        typed = best_of(lambda: decode_products(raw), args.repeat)
+        print(f"  typed decode + validate ({jsonlib.BACKEND}): {typed * 1000:.2f} ms")
+
+
+def _catalog_memory(raws, copies, build):
+    """Bytes still held after loading every file copies times (a merged catalog), and the peak on the way."""
+    tracemalloc.start()
+    catalog = []
+    for _ in range(copies):
+        for raw in raws:
+            catalog.extend(build(jsonlib.loads(raw)))
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(catalog), held, peak
+
+
+async def bench_records(args):
+    raws = []
+    for path in args.files:
+        with open(path, "rb") as f:
+            raws.append(f.read())
+    results = {
+        "dicts": _catalog_memory(raws, args.copies, lambda data: data),
+        "records": _catalog_memory(raws, args.copies, lambda data: [Product.from_dict(item) for item in data]),
+    }
+    baseline = results["dicts"][1]
+    for name, (count, held, peak) in results.items():
+        print(f"{name:>8}: {count} products, {held / 2 ** 20:7.1f} MB held ({baseline / held:.2f}x), "
+              f"{peak / 2 ** 20:7.1f} MB peak")
+
+
+SCRAPERS = {
+    "foreignfortune": ForeignFortuneScraper,
+    "lechocolat": ChocolateScraper,
+    "traderjoes": TraderJoesScraper,
+}
+
+# an offline run is flagged when a metric moves this much the wrong way against the baseline
+REGRESSION_CHECKS = {"products_per_second": -1, "p99_page_latency": 1, "cpu_time": 1, "peak_rss_mb": 1}
+
+
+async def bench_record(args):
+    archive = FixtureArchive(args.out)
+    try:
+        for site in args.sites:
+            if site == "traderjoes":
+                scraper = TraderJoesScraper(recorder=archive)
+            else:
+                scraper = SCRAPERS[site]()
+                scraper.client.recorder = archive
+            before = archive.records
+            products = await scraper.scrape()
+            if site != "traderjoes":
+                await scraper.client.close()
+            print(f"{site}: recorded {archive.records - before} responses, {len(products)} products")
+    finally:
+        archive.close()
+
+
+async def _scrape_offline(site, base, fixtures, replay, rate_limit):
+    if site == "traderjoes":
+        scraper = TraderJoesScraper(replay=BrowserReplay(FixtureArchive(fixtures).load(), **replay))
+    else:
+        scraper = SCRAPERS[site]()
+        scraper.client.url_rewriter = rewrite_to(base)
+        if not rate_limit:
+            scraper.client.rate_limiter = None
+    # the same engine scrape() runs, kept here for its stats
+    engine = scraper.engine()
+    try:
+        products = [product async for product in engine.iter_products()]
+    finally:
+        if site != "traderjoes":
+            await scraper.client.close()
+    return len(products), engine.summary()
+
+
+def _run_offline(site, base, fixtures, replay, rate_limit):
+    """One measured run, in a fresh worker process so CPU time and peak RSS belong to this site alone."""
+    METRICS.reset()
+    cpu_start = time.process_time()
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    products, summary = asyncio.run(_scrape_offline(site, base, fixtures, replay, rate_limit))
+    wall = time.perf_counter() - start
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    latency = Histogram()
+    for name, labels, histogram in METRICS.snapshot()["histograms"]:
+        if name == "fetch_seconds" and ("site", site) in map(tuple, labels):
+            latency.merge(histogram)
+    return {
+        "products": products,
+        "pages": latency.count,
+        "wall_time": wall,
+        "products_per_second": products / wall if wall else 0.0,
+        "pages_per_second": latency.count / wall if wall else 0.0,
+        "p50_page_latency": latency.quantile(0.5),
+        "p99_page_latency": latency.quantile(0.99),
+        # browser processes are children, count them in
+        "cpu_time": time.process_time() - cpu_start
+                    + (children.ru_utime - children_start.ru_utime) + (children.ru_stime - children_start.ru_stime),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "retries": summary["retries"],
+        "failed": summary["failed"],
+    }
+
+
+def _median_run(runs):
+    return {key: statistics.median(run[key] for run in runs) if runs[0][key] is not None else None
+            for key in runs[0]}
+
+
+def check_regressions(results, baseline, tolerance):
+    regressions = []
+    for site, current in results.items():
+        previous = baseline.get("results", {}).get(site)
+        if not previous:
+            continue
+        for metric, direction in REGRESSION_CHECKS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change * direction > tolerance:
+                regressions.append(f"{site} {metric}: {old:.4g} -> {new:.4g} ({change:+.0%})")
+    return regressions
+
+
+async def bench_offline(args):
+    replay = {"latency_ms": args.latency, "jitter_ms": args.jitter, "error_rate": args.error_rate, "seed": args.seed}
+    context = multiprocessing.get_context("spawn")
+    ready, stop = context.Queue(), context.Event()
+    server = context.Process(target=serve_replay, args=(args.fixtures, replay, ready, stop), daemon=True)
+    server.start()
+    base = ready.get(timeout=60)
+    loop = asyncio.get_running_loop()
+
+    results = {}
+    try:
+        for site in args.sites:
+            runs = []
+            for _ in range(args.repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    runs.append(await loop.run_in_executor(
+                        pool, _run_offline, site, base, args.fixtures, replay, args.rate_limit))
+            results[site] = _median_run(runs)
+    finally:
+        stop.set()
+        server_stats = ready.get(timeout=10) if server.is_alive() else {}
+        server.join(timeout=10)
+
+    print(f"{'site':<16}{'products':>9}{'pages':>7}{'wall s':>8}{'prod/s':>9}{'pages/s':>9}"
+          f"{'p50 ms':>8}{'p99 ms':>8}{'cpu s':>7}{'rss MB':>8}")
+    for site, r in results.items():
+        p50 = r["p50_page_latency"] * 1000 if r["p50_page_latency"] is not None else float("nan")
+        p99 = r["p99_page_latency"] * 1000 if r["p99_page_latency"] is not None else float("nan")
+        print(f"{site:<16}{r['products']:>9.0f}{r['pages']:>7.0f}{r['wall_time']:>8.2f}{r['products_per_second']:>9.2f}"
+              f"{r['pages_per_second']:>9.2f}{p50:>8.1f}{p99:>8.1f}{r['cpu_time']:>7.2f}{r['peak_rss_mb']:>8.1f}")
+    print(f"replay server (HTTP sites): {server_stats}")
+
+    report = {"config": {**replay, "repeat": args.repeat, "rate_limit": args.rate_limit}, "results": results}
+    if args.save:
+        with open(args.save, "wb") as f:
+            f.write(jsonlib.dumps_bytes(report, indent=2))
+    if args.baseline:
+        with open(args.baseline, "rb") as f:
+            regressions = check_regressions(results, jsonlib.loads(f.read()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            raise SystemExit(1)
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    scroll = sub.add_parser("scroll", help="time-to-complete-list, auto_scroll polling vs MutationObserver")
+    scroll.add_argument("--items", type=int, default=200)
+    scroll.add_argument("--batch", type=int, default=20)
+    scroll.add_argument("--delay", type=int, default=50, help="lazy-load delay per batch in ms")
+    scroll.add_argument("--repeat", type=int, default=3)
+    scroll.set_defaults(func=bench_scroll)
+
+    parse = sub.add_parser("parse", help="per-page parse time over saved pages, before vs after extraction.py")
+    parse.add_argument("--kind", choices=["ff-collection", "ff-product", "tj-listing"], required=True)
+    parse.add_argument("--repeat", type=int, default=5)
+    parse.add_argument("pages", nargs="+", help="saved HTML files or glob patterns")
+    parse.set_defaults(func=bench_parse)
+
+    json_bench = sub.add_parser("json", help="JSON decode/encode per backend over output files")
+    json_bench.add_argument("--repeat", type=int, default=20)
+    json_bench.add_argument("files", nargs="+")
+    json_bench.set_defaults(func=bench_json)
+
+    records = sub.add_parser("records", help="memory held by a merged catalog as dicts vs slotted records")
+    records.add_argument("--copies", type=int, default=20, help="load each file this many times")
+    records.add_argument("files", nargs="+")
+    records.set_defaults(func=bench_records)
+
+    record = sub.add_parser("record", help="crawl the live sites once and archive every response as fixtures")
+    record.add_argument("--out", default="fixtures/sites.jsonl.gz")
+    record.add_argument("--sites", nargs="+", choices=list(SCRAPERS), default=list(SCRAPERS))
+    record.set_defaults(func=bench_record)
+
+    offline = sub.add_parser("offline", help="run the scrapers against replayed fixtures and report throughput")
+    offline.add_argument("--fixtures", default="fixtures/sites.jsonl.gz")
+    offline.add_argument("--sites", nargs="+", choices=list(SCRAPERS), default=list(SCRAPERS))
+    offline.add_argument("--latency", type=float, default=50, help="injected server latency in ms")
+    offline.add_argument("--jitter", type=float, default=20, help="+/- ms added to the latency")
+    offline.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    offline.add_argument("--seed", type=int, default=1)
+    offline.add_argument("--repeat", type=int, default=3, help="runs per site, the median is reported")
+    offline.add_argument("--rate-limit", action="store_true",
+                         help="keep the scrapers' adaptive rate limiters (off by default, they dominate offline timings)")
+    offline.add_argument("--save", metavar="PATH", help="write the results as JSON, e.g. as the next baseline")
+    offline.add_argument("--baseline", metavar="PATH", help="earlier --save output to compare against")
+    offline.add_argument("--tolerance", type=float, default=0.15, help="allowed relative change before failing")
+    offline.set_defaults(func=bench_offline)
+
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+from typing import Callable, Awaitable, Optional
+from contextlib import asynccontextmanager
+import asyncio
+
+
+class PagePool:
+    """Fixed-size pool of pyppeteer tabs that product urls are dispatched to.
+
+    A tab that crashed or was closed is thrown away on release and a fresh one
+    takes its place, so one bad page does not shrink the pool for the rest of the run.
+    """
+
+    def __init__(self, browser, size: int = 4,
+                 setup: Optional[Callable[[object], Awaitable[None]]] = None):
+        self.browser = browser
+        self.size = size
+        self.setup = setup
+        self.queue = asyncio.Queue()
+        self.crashed = set()
+        self.recycled = 0
+        # refills in flight: the loop only keeps weak references to tasks
+        self.tasks = set()
+
+    async def _new_page(self):
+        page = await self.browser.newPage()
+        page.on('error', lambda *args, page=page: self.crashed.add(page))
+        if self.setup:
+            await self.setup(page)
+        return page
+
+    async def start(self):
+        for _ in range(self.size):
+            self.queue.put_nowait(await self._new_page())
+
+    async def _recycle(self, page):
+        self.crashed.discard(page)
+        self.recycled += 1
+        try:
+            if not page.isClosed():
+                await page.close()
+        except Exception as e:
+            print(f"Error closing crashed page: {e}")
+        return await self._new_page()
+
+    @asynccontextmanager
+    async def page(self):
+        page = await self.queue.get()
+        try:
+            if page in self.crashed or page.isClosed():
+                page = await self._recycle(page)
+            yield page
+        finally:
+            if page is not None and (page in self.crashed or page.isClosed()):
+                try:
+                    page = await self._recycle(page)
+                except Exception as e:
+                    print(f"Error replacing crashed page: {e}")
+                    page = None
+            if page is not None:
+                self.queue.put_nowait(page)
+            else:
+                # keep the pool at size even when the replacement failed
+                task = asyncio.ensure_future(self._refill())
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+    async def _refill(self):
+        try:
+            self.queue.put_nowait(await self._new_page())
+        except Exception as e:
+            print(f"Error refilling page pool: {e}")
+
+    async def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        while not self.queue.empty():
+            page = self.queue.get_nowait()
+            try:
+                await page.close()
+            except Exception:
+                pass
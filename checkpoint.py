@@ -0,0 +1,75 @@
+from typing import Dict, Any, Optional
+import jsonlib
+import os
+import sqlite3
+
+
+class CheckpointStore:
+    """SQLite record of finished listing pages and parsed products, so a failed crawl can resume.
+
+    Every scraper writes to its own `site` rows; a fresh (non --resume) run
+    clears them first.
+    """
+
+    def __init__(self, path: str = "output/checkpoints.sqlite", site: str = "default"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.site = site
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "site TEXT, page_key TEXT, data TEXT, PRIMARY KEY (site, page_key))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            "site TEXT, product_key TEXT, data TEXT, PRIMARY KEY (site, product_key))"
+        )
+        self.conn.commit()
+        self.skipped_pages = 0
+        self.skipped_products = 0
+
+    def clear(self):
+        self.conn.execute("DELETE FROM pages WHERE site = ?", (self.site,))
+        self.conn.execute("DELETE FROM products WHERE site = ?", (self.site,))
+        self.conn.commit()
+
+    def get_page(self, page_key: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT data FROM pages WHERE site = ? AND page_key = ?", (self.site, page_key)
+        ).fetchone()
+        if row is None:
+            return None
+        self.skipped_pages += 1
+        return jsonlib.loads(row[0])
+
+    def mark_page(self, page_key: str, data: Dict[str, Any]):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages (site, page_key, data) VALUES (?, ?, ?)",
+            (self.site, page_key, jsonlib.dumps(data)),
+        )
+        self.conn.commit()
+
+    def get_product(self, product_key: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT data FROM products WHERE site = ? AND product_key = ?", (self.site, product_key)
+        ).fetchone()
+        if row is None:
+            return None
+        self.skipped_products += 1
+        return jsonlib.loads(row[0])
+
+    def save_product(self, product_key: str, product: Dict[str, Any]):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO products (site, product_key, data) VALUES (?, ?, ?)",
+            (self.site, product_key, jsonlib.dumps(product)),
+        )
+        self.conn.commit()
+
+    def summary(self) -> Dict[str, int]:
+        return {"skipped_pages": self.skipped_pages, "skipped_products": self.skipped_products}
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,209 @@
+"""Columnar export of scraped products: products, models and variants as separate tables.
+
+    python columnar_export.py output/foreignfortune.ndjson --site foreignfortune --out output/columnar
+
+Each table is a directory of part files (Parquet or Arrow IPC) keyed by
+product_id, so every run or streaming scraper session appends a new part and
+readers open the directory as one dataset (pyarrow.dataset.dataset(path)).
+"""
+from typing import Dict, Any, List, Optional
+import argparse
+import os
+import time
+import uuid
+
+from records import parse_number
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # columnar export is optional
+    pa = None
+
+
+def _schemas() -> Dict[str, Any]:
+    # brand, color, size, site and availability repeat a handful of values: dictionary-encode them
+    dict_string = pa.dictionary(pa.int32(), pa.string())
+    return {
+        "products": pa.schema([
+            ("product_id", pa.string()),
+            ("site", dict_string),
+            ("title", pa.string()),
+            ("price", pa.float64()),
+            ("sales_price", pa.float64()),
+            ("url", pa.string()),
+            ("brand", dict_string),
+            ("image", pa.string()),
+            ("description", pa.string()),
+            ("availability", dict_string),
+            ("categories", pa.list_(pa.string())),
+        ]),
+        "models": pa.schema([
+            ("product_id", pa.string()),
+            ("site", dict_string),
+            ("model_index", pa.int32()),
+            ("color", dict_string),
+            ("title", pa.string()),
+            ("link", pa.string()),
+        ]),
+        "variants": pa.schema([
+            ("product_id", pa.string()),
+            ("site", dict_string),
+            ("model_index", pa.int32()),
+            ("variant_id", pa.string()),
+            ("size", dict_string),
+            ("price", pa.float64()),
+            ("image", pa.string()),
+        ]),
+    }
+
+
+SCHEMAS = _schemas() if pa is not None else {}
+
+
+def flatten(product: Dict[str, Any], site: Optional[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """Split one scraped product into its products / models / variants rows."""
+    product_id = str(product.get("id"))
+    sales_prices = product.get("sales_prices") or []
+    rows = {
+        "products": [{
+            "product_id": product_id,
+            "site": site,
+            "title": product.get("title"),
+            "price": parse_number(product.get("price")),
+            "sales_price": parse_number(sales_prices[0]) if sales_prices else None,
+            "url": product.get("url"),
+            "brand": product.get("brand"),
+            "image": product.get("image"),
+            "description": product.get("description"),
+            "availability": product.get("availability"),
+            "categories": product.get("categories"),
+        }],
+        "models": [],
+        "variants": [],
+    }
+    for index, model in enumerate(product.get("models") or []):
+        rows["models"].append({
+            "product_id": product_id,
+            "site": site,
+            "model_index": index,
+            "color": model.get("color"),
+            "title": model.get("title"),
+            "link": model.get("link"),
+        })
+        for variant in model.get("variants") or []:
+            rows["variants"].append({
+                "product_id": product_id,
+                "site": site,
+                "model_index": index,
+                "variant_id": str(variant.get("id")),
+                "size": variant.get("size"),
+                "price": parse_number(variant.get("price")),
+                "image": variant.get("image"),
+            })
+    return rows
+
+
+class ColumnarExporter:
+    """Sink with the same write()/context-manager shape as output_writer.NDJSONWriter.
+
+    Rows are buffered per table and written as one row group / record batch
+    every batch_size products, so memory stays bounded while a scraper streams.
+    """
+
+    def __init__(self, out_dir: str = "output/columnar", site: Optional[str] = None,
+                 format: str = "parquet", batch_size: int = 1000, compression: str = "zstd"):
+        if pa is None:
+            raise RuntimeError("columnar export needs the 'pyarrow' package")
+        if format not in ("parquet", "arrow"):
+            raise ValueError(f"Unknown columnar format: {format}")
+        self.out_dir = out_dir
+        self.site = site
+        self.format = format
+        self.batch_size = batch_size
+        self.compression = compression
+        self.part = f"part-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.buffers = {table: [] for table in SCHEMAS}
+        self.writers = {}
+        self.sinks = {}
+        self.pending = 0
+        self.count = 0
+
+    def _writer(self, table: str):
+        if table not in self.writers:
+            directory = os.path.join(self.out_dir, table)
+            os.makedirs(directory, exist_ok=True)
+            schema = SCHEMAS[table]
+            if self.format == "parquet":
+                path = os.path.join(directory, f"{self.part}.parquet")
+                self.writers[table] = pq.ParquetWriter(path, schema, compression=self.compression,
+                                                       use_dictionary=True)
+            else:
+                path = os.path.join(directory, f"{self.part}.arrow")
+                self.sinks[table] = pa.OSFile(path, "wb")
+                self.writers[table] = ipc.new_file(self.sinks[table], schema)
+        return self.writers[table]
+
+    def write(self, product: Dict[str, Any]):
+        if hasattr(product, "to_dict"):
+            product = product.to_dict()
+        for table, rows in flatten(product, self.site).items():
+            self.buffers[table].extend(rows)
+        self.count += 1
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for table, rows in self.buffers.items():
+            if not rows:
+                continue
+            batch = pa.RecordBatch.from_pylist(rows, schema=SCHEMAS[table])
+            self._writer(table).write_batch(batch)
+            self.buffers[table] = []
+        self.pending = 0
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            # a part only becomes readable once its footer is written, keep what was flushed
+            for writer in self.writers.values():
+                writer.close()
+            for sink in self.sinks.values():
+                sink.close()
+            self.writers = {}
+            self.sinks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_file(src: str, out_dir: str, site: Optional[str] = None, format: str = "parquet",
+                batch_size: int = 1000) -> int:
+    # validation configures logging on import, keep it out of scraper processes that only write
+    from validation import iter_products
+    with ColumnarExporter(out_dir, site=site, format=format, batch_size=batch_size) as exporter:
+        for product in iter_products(src):
+            exporter.write(product)
+    return exporter.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("src", help="scraped JSON array or NDJSON file")
+    parser.add_argument("--out", default="output/columnar")
+    parser.add_argument("--site", help="value for the site column, e.g. foreignfortune")
+    parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    count = export_file(args.src, args.out, site=args.site, format=args.format, batch_size=args.batch_size)
+    print(f"Exported {count} products to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
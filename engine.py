@@ -0,0 +1,448 @@
+"""Shared asyncio crawl engine. Every site plugs into it as a SiteAdapter.
+
+The engine owns the URL frontier, the worker pool, dedup, retries, the
+checkpoint/incremental stores and the output sinks. An adapter only knows
+its site: where the listing pages start, how to read product URLs (and the
+next listing pages) out of one, and which function parses a product page.
+"""
+from typing import Dict, Any, List, Tuple, Iterable, Optional, AsyncIterator, Callable
+from collections import deque
+from dataclasses import dataclass, field
+import asyncio
+import random
+import time
+
+from http_client import HttpClient
+from checkpoint import CheckpointStore
+from incremental import IncrementalStore, fetch_incremental
+from parse_executor import ParseExecutor
+from metrics import METRICS
+
+LISTING = "listing"
+PRODUCT = "product"
+
+# (url, meta) pairs, as handed from an adapter to the frontier
+Link = Tuple[str, Dict[str, Any]]
+
+
+class CrawlError(Exception):
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+@dataclass(order=True)
+class CrawlRequest:
+    priority: int
+    seq: int
+    kind: str = field(compare=False)
+    url: str = field(compare=False)
+    key: str = field(compare=False)
+    meta: Dict[str, Any] = field(compare=False, default_factory=dict)
+    attempt: int = field(compare=False, default=0)
+    # times put back because the host's circuit breaker was open; these don't use up attempts
+    deferrals: int = field(compare=False, default=0)
+    queued_at: float = field(compare=False, default=0.0)
+
+
+@dataclass
+class Listing:
+    products: List[Link] = field(default_factory=list)
+    next_pages: List[Link] = field(default_factory=list)
+
+
+class SiteAdapter:
+    """Site-specific half of a crawl. Subclasses fill in seeds, parse_listing and parse_task."""
+
+    name = "site"
+    # lower runs first: listing pages are read ahead so the workers never run dry
+    listing_priority = 0
+    product_priority = 1
+    # plain HTTP sites go through HttpClient (and the incremental store), browser sites override fetch
+    http = True
+    # hold finished products back while discovery or listing pages are still running, for sites that
+    # merge listing data into them (merge_duplicate); after that they are released as they finish
+    hold_products = False
+    # crawl seeds() even when discover() found products, for listing pages that carry data products need
+    listings_with_discovery = False
+
+    def seeds(self) -> Iterable[Link]:
+        raise NotImplementedError
+
+    async def discover(self, engine: "CrawlEngine") -> AsyncIterator[Link]:
+        """Product links known without reading listing pages, e.g. from a sitemap.
+
+        They go straight onto the frontier as they arrive. If none turn up the
+        engine falls back to crawling seeds().
+        """
+        return
+        yield
+
+    def parse_listing(self, url: str, html: str, meta: Dict[str, Any]) -> Listing:
+        raise NotImplementedError
+
+    def parse_task(self, request: CrawlRequest) -> Tuple[Callable[..., Any], tuple]:
+        """Module-level (picklable) parse function and its extra args; it is called as fn(html, *args)."""
+        raise NotImplementedError
+
+    def listing_key(self, url: str, meta: Dict[str, Any]) -> str:
+        return url
+
+    def product_key(self, url: str, meta: Dict[str, Any]) -> str:
+        return url
+
+    def merge_duplicate(self, meta: Dict[str, Any], duplicate: Dict[str, Any]):
+        """Called when a product key is discovered again, e.g. from a second category,
+        or when two keys turn out to be the same product id once parsed (too late to
+        change the first record if it was already released to the sinks)."""
+
+    def finish_product(self, product: Dict[str, Any], request: CrawlRequest) -> Dict[str, Any]:
+        return product
+
+    async def product(self, engine: "CrawlEngine", request: CrawlRequest) -> Optional[Dict[str, Any]]:
+        """Build one product record. The default fetches the product page and runs parse_task on it."""
+        return await engine.fetch_product(request)
+
+    def summary(self) -> Dict[str, Any]:
+        """Site-specific counters for CrawlEngine.summary()."""
+        return {}
+
+    async def fetch(self, engine: "CrawlEngine", request: CrawlRequest) -> Optional[str]:
+        return await engine.fetch_text(request.url)
+
+    async def open(self, engine: "CrawlEngine"):
+        pass
+
+    async def close(self):
+        pass
+
+
+_DONE = object()
+
+
+class CrawlEngine:
+    """Prioritized frontier plus a fixed pool of worker tasks.
+
+    Listing and product pages share the pool. Product keys are deduplicated
+    across the whole run, failed fetches are retried with jittered
+    exponential backoff, and finished products go to every sink (anything
+    with a write() method, like output_writer.NDJSONWriter) in the order
+    their urls were discovered: a product that finishes early waits in a
+    small reorder buffer until every product discovered before it is done.
+    """
+
+    def __init__(self, adapter: SiteAdapter, client: HttpClient = None, concurrency: int = 8,
+                 max_retries: int = 2, retry_backoff: float = 1.0, max_deferrals: int = 20,
+                 checkpoint: CheckpointStore = None, incremental: IncrementalStore = None,
+                 parser: ParseExecutor = None, sinks: Iterable[Any] = ()):
+        self.adapter = adapter
+        self.owns_client = client is None and adapter.http
+        self.client = client or (HttpClient() if adapter.http else None)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_deferrals = max_deferrals
+        self.checkpoint = checkpoint
+        self.incremental = incremental if adapter.http else None
+        self.parser = parser or ParseExecutor()
+        self.sinks = list(sinks)
+        self.frontier = None
+        self.output = None
+        self.seq = 0
+        self.seen = set()
+        self.product_requests = {}
+        # product id -> request of the record kept for it
+        self.product_ids = {}
+        # product requests in discovery order, and the finished ones by seq (None: failed or duplicate)
+        self.pending = deque()
+        self.done = {}
+        # listing requests pushed and not yet read or given up on, and whether discover() still runs
+        self.listings_open = 0
+        self.discovering = True
+        self.started_at = None
+        self.stats = {
+            "listings": 0,
+            "products": 0,
+            "retries": 0,
+            "deferred": 0,
+            "failed": 0,
+            "sink_errors": 0,
+            "duplicate_urls": 0,
+            "duplicate_ids": 0,
+            "discovered": 0,
+            "frontier_peak": 0,
+            "queue_wait": 0.0,
+            "fetch_time": 0.0,
+            "parse_time": 0.0,
+        }
+
+    def _push(self, kind: str, url: str, meta: Dict[str, Any]):
+        if kind == LISTING:
+            key = self.adapter.listing_key(url, meta)
+            priority = self.adapter.listing_priority
+        else:
+            key = self.adapter.product_key(url, meta)
+            priority = self.adapter.product_priority
+        if (kind, key) in self.seen:
+            if kind == PRODUCT:
+                self.stats["duplicate_urls"] += 1
+                self.adapter.merge_duplicate(self.product_requests[key].meta, meta)
+            return
+        self.seen.add((kind, key))
+        if kind == LISTING:
+            self.listings_open += 1
+        self.seq += 1
+        request = CrawlRequest(priority, self.seq, kind, url, key, dict(meta), queued_at=time.perf_counter())
+        if kind == PRODUCT:
+            self.product_requests[key] = request
+            self.pending.append(request)
+        self.frontier.put_nowait(request)
+        self.stats["frontier_peak"] = max(self.stats["frontier_peak"], self.frontier.qsize())
+
+    async def fetch_text(self, url: str, headers: Optional[Dict[str, str]] = None) -> str:
+        # HttpClient's FetchPolicy already retried; its FetchError comes back with retryable=False,
+        # except CircuitOpenError, which _handle puts back once the circuit may have closed
+        result = await self.client.fetch(url, headers=headers)
+        return result.text
+
+    async def _fetch(self, request: CrawlRequest, url: Optional[str] = None) -> str:
+        start = time.perf_counter()
+        try:
+            html = await (self.fetch_text(url) if url else self.adapter.fetch(self, request))
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats["fetch_time"] += elapsed
+            METRICS.observe("fetch_seconds", elapsed, site=self.adapter.name, kind=request.kind)
+        if not html:
+            raise CrawlError(f"No content for {url or request.url}")
+        METRICS.observe("page_bytes", len(html), site=self.adapter.name, kind=request.kind)
+        return html
+
+    async def _parse(self, request: CrawlRequest, html: str,
+                     task: Optional[Tuple[Callable[..., Any], tuple]] = None) -> Optional[Dict[str, Any]]:
+        fn, args = task or self.adapter.parse_task(request)
+        start = time.perf_counter()
+        product = await self.parser.run(fn, html, *args)
+        elapsed = time.perf_counter() - start
+        self.stats["parse_time"] += elapsed
+        METRICS.observe("parse_seconds", elapsed, site=self.adapter.name)
+        return product
+
+    async def _listing(self, request: CrawlRequest):
+        done = self.checkpoint.get_page(request.key) if self.checkpoint else None
+        if done is not None and "requests" in done:
+            listing = Listing([tuple(link) for link in done["requests"]],
+                              [tuple(link) for link in done["next_pages"]])
+        else:
+            html = await self._fetch(request)
+            listing = self.adapter.parse_listing(request.url, html, request.meta)
+            if self.checkpoint:
+                self.checkpoint.mark_page(request.key, {
+                    "requests": [list(link) for link in listing.products],
+                    "next_pages": [list(link) for link in listing.next_pages],
+                })
+        self.stats["listings"] += 1
+        for url, meta in listing.products:
+            self._push(PRODUCT, url, meta)
+        for url, meta in listing.next_pages:
+            self._push(LISTING, url, meta)
+
+    async def _product(self, request: CrawlRequest):
+        product = self.checkpoint.get_product(request.key) if self.checkpoint else None
+        if product is None:
+            product = await self.adapter.product(self, request)
+            if product and self.checkpoint:
+                self.checkpoint.save_product(request.key, product)
+        if not product:
+            self.stats["failed"] += 1
+            METRICS.inc("errors_total", site=self.adapter.name, kind=PRODUCT, error="parse")
+            self._finish(request, None)
+            return
+        # two urls can still resolve to the same product id: keep the first, merge the other's meta into it
+        product_id = product.get("id")
+        if product_id is not None:
+            first = self.product_ids.get(product_id)
+            if first is not None:
+                self.stats["duplicate_ids"] += 1
+                self.adapter.merge_duplicate(first.meta, request.meta)
+                self._finish(request, None)
+                return
+            self.product_ids[product_id] = request
+        self._finish(request, product)
+
+    @property
+    def holding(self) -> bool:
+        return self.adapter.hold_products and (self.discovering or self.listings_open > 0)
+
+    def _listed(self):
+        # the last listing page is in: every merge_duplicate from the listings is done
+        self.listings_open -= 1
+        if not self.holding:
+            self._release()
+
+    async def fetch_product(self, request: CrawlRequest, url: Optional[str] = None,
+                            task: Optional[Tuple[Callable[..., Any], tuple]] = None) -> Optional[Dict[str, Any]]:
+        """Fetch the product page (or another url for it, parsed by task) through the incremental store if any."""
+        if self.incremental:
+            task = task or self.adapter.parse_task(request)
+            # only what the parse reads decides a reparse; request.meta can hold more (e.g. Le Chocolat's
+            # categories, applied in finish_product and still being merged while pages are fetched)
+            return await fetch_incremental(
+                self.client, self.incremental, url or request.url,
+                lambda html: self._parse(request, html, task), meta={"parse_args": task[1]},
+            )
+        return await self._parse(request, await self._fetch(request, url), task)
+
+    def _emit(self, request: CrawlRequest, product: Dict[str, Any]):
+        product = self.adapter.finish_product(product, request)
+        self.stats["products"] += 1
+        METRICS.inc("products_total", site=self.adapter.name)
+        for sink in self.sinks:
+            # a failing sink is an output problem, not a fetch to retry: the product is done either way
+            try:
+                sink.write(product)
+            except Exception as e:
+                self.stats["sink_errors"] += 1
+                METRICS.inc("errors_total", site=self.adapter.name, kind="sink", error=type(e).__name__)
+                print(f"[{self.adapter.name}] {type(sink).__name__} could not write {request.url}: {e}")
+        self.output.put_nowait(product)
+
+    def _finish(self, request: CrawlRequest, product: Optional[Dict[str, Any]]):
+        self.done[request.seq] = product
+        if not self.holding:
+            self._release()
+
+    def _release(self):
+        # emit the finished prefix of the discovery order
+        while self.pending and self.pending[0].seq in self.done:
+            request = self.pending.popleft()
+            product = self.done.pop(request.seq)
+            if product is not None:
+                self._emit(request, product)
+
+    async def _handle(self, request: CrawlRequest):
+        try:
+            if request.kind == LISTING:
+                await self._listing(request)
+                self._listed()
+            else:
+                await self._product(request)
+        except Exception as e:
+            METRICS.inc("errors_total", site=self.adapter.name, kind=request.kind, error=type(e).__name__)
+            # the site is shedding load (circuit open): wait out the breaker, then try again
+            retry_in = getattr(e, "retry_in", None)
+            if retry_in is not None and request.deferrals < self.max_deferrals:
+                request.deferrals += 1
+                self.stats["deferred"] += 1
+                await asyncio.sleep(retry_in * random.uniform(1.0, 1.5))
+                request.queued_at = time.perf_counter()
+                self.frontier.put_nowait(request)
+                return
+            retryable = getattr(e, "retryable", True)
+            if retryable and request.attempt < self.max_retries:
+                request.attempt += 1
+                self.stats["retries"] += 1
+                delay = self.retry_backoff * 2 ** (request.attempt - 1)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+                request.queued_at = time.perf_counter()
+                self.frontier.put_nowait(request)
+                return
+            self.stats["failed"] += 1
+            print(f"[{self.adapter.name}] giving up on {request.kind} {request.url}: {e}")
+            if request.kind == PRODUCT:
+                self._finish(request, None)
+            else:
+                self._listed()
+
+    async def _worker(self):
+        while True:
+            request = await self.frontier.get()
+            waited = time.perf_counter() - request.queued_at
+            self.stats["queue_wait"] += waited
+            METRICS.observe("queue_wait_seconds", waited, site=self.adapter.name, kind=request.kind)
+            try:
+                await self._handle(request)
+            finally:
+                self.frontier.task_done()
+
+    def _push_seeds(self):
+        for url, meta in self.adapter.seeds():
+            self._push(LISTING, url, meta)
+
+    async def _discover(self):
+        if self.adapter.listings_with_discovery:
+            self._push_seeds()
+        complete = True
+        try:
+            async for url, meta in self.adapter.discover(self):
+                self.stats["discovered"] += 1
+                self._push(PRODUCT, url, meta)
+        except Exception as e:
+            complete = False
+            METRICS.inc("errors_total", site=self.adapter.name, kind="discovery", error=type(e).__name__)
+            print(f"[{self.adapter.name}] discovery failed after {self.stats['discovered']} products: {e}")
+        # a partial discovery still gets the listing crawl; product ids dedup the overlap in _product
+        if (not complete or not self.stats["discovered"]) and not self.adapter.listings_with_discovery:
+            self._push_seeds()
+        self.discovering = False
+        if not self.holding:
+            self._release()
+
+    async def _drain(self):
+        # products are still being discovered while the first ones are fetched
+        await self._discover()
+        await self.frontier.join()
+        self._release()
+        self.output.put_nowait(_DONE)
+
+    async def run(self) -> int:
+        """Crawl into the sinks only, returns the number of products written."""
+        async for _ in self.iter_products():
+            pass
+        return self.stats["products"]
+
+    async def iter_products(self) -> AsyncIterator[Dict[str, Any]]:
+        self.frontier = asyncio.PriorityQueue()
+        self.output = asyncio.Queue()
+        self.started_at = time.perf_counter()
+        workers = []
+        drain = None
+        try:
+            await self.adapter.open(self)
+            workers = [asyncio.ensure_future(self._worker()) for _ in range(self.concurrency)]
+            drain = asyncio.ensure_future(self._drain())
+            while True:
+                product = await self.output.get()
+                if product is _DONE:
+                    break
+                yield product
+        finally:
+            for task in workers + ([drain] if drain else []):
+                task.cancel()
+            await asyncio.gather(*workers, *([drain] if drain else []), return_exceptions=True)
+            await self.adapter.close()
+            if self.owns_client:
+                await self.client.close()
+
+    def progress(self) -> Dict[str, Any]:
+        """Cheap snapshot for progress lines while the crawl runs."""
+        return {
+            "products": self.stats["products"],
+            "listings": self.stats["listings"],
+            "failed": self.stats["failed"],
+            "retries": self.stats["retries"],
+            "frontier": self.frontier.qsize() if self.frontier else 0,
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        fetched = max(stats["listings"] + stats["products"] + stats["failed"], 1)
+        stats["avg_queue_wait"] = stats["queue_wait"] / fetched
+        if self.started_at is not None:
+            wall = time.perf_counter() - self.started_at
+            stats["wall_time"] = wall
+            stats["products_per_second"] = stats["products"] / wall if wall else 0.0
+        stats.update(self.adapter.summary())
+        if self.client:
+            stats["http"] = self.client.summary()
+        return stats
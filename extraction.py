@@ -0,0 +1,72 @@
+"""Precompiled extraction helpers shared by the scrapers.
+
+Regexes and XPath expressions are compiled once at import time, and the
+XPaths are evaluated relative to lxml nodes (Selector.root) instead of
+serializing elements back to HTML and reparsing them.
+"""
+from typing import Any, List, Optional
+import json
+import re
+from lxml import etree
+
+import jsonlib
+from metrics import METRICS
+
+# Foreign Fortune (Shopify web-pixels script)
+WEB_PIXELS_SCRIPT = etree.XPath("//script[@id='web-pixels-manager-setup']/text()")
+COLLECTION_VIEWED_RE = re.compile(r'publish\("collection_viewed",\s*(.*?)\s*\);}', re.DOTALL)
+COLLECTION_VIEWED_MARKER = re.compile(r'publish\("collection_viewed",\s*')
+INIT_DATA_RE = re.compile(r'isMerchantRequest: false,initData:\s*(.*?)\s*,\},function pageEvents', re.DOTALL)
+INIT_DATA_MARKER = re.compile(r'isMerchantRequest: false,initData:\s*')
+PAGINATION_LAST_HREF = etree.XPath("//ul[@class='list--inline pagination']/li[last()]/a/@href")
+
+# Trader Joe's listing cards, relative to each <li>
+TJ_LIST_ITEMS = etree.XPath("//ul[@class='ProductList_productList__list__3-dGs']/li")
+TJ_ITEM_URL = etree.XPath(".//section/a/@href")
+TJ_ITEM_IMAGE = etree.XPath(".//section/a/div//source/@srcset")
+TJ_ITEM_PRICE = etree.XPath(
+    ".//section/div/div[@class='ProductPrice_productPrice__1Rq1r ProductCard_card__productPrice__1W4Le']"
+    "/div/span[@class='ProductPrice_productPrice__price__3-50j']/text()"
+)
+TJ_ITEM_UNIT = etree.XPath(
+    ".//section/div/div[@class='ProductPrice_productPrice__1Rq1r ProductCard_card__productPrice__1W4Le']"
+    "/div/span[@class='ProductPrice_productPrice__unit__2jvkA']/text()"
+)
+
+MAX_JSON_LENGTH = 5_000_000
+_DECODER = json.JSONDecoder()
+
+
+def first(xpath: etree.XPath, node) -> Optional[str]:
+    result = xpath(node)
+    return str(result[0]) if result else None
+
+
+def all_text(xpath: etree.XPath, node) -> List[str]:
+    return [str(r) for r in xpath(node)]
+
+
+def scan_json(text: str, start: int = 0, max_length: int = MAX_JSON_LENGTH) -> Any:
+    """Decode the JSON value that starts at start (leading whitespace allowed).
+
+    json's raw_decode reads a single value left to right and stops at its end,
+    so there is no backtracking over the rest of the script. The input is
+    bounded to max_length characters; returns None if nothing decodes.
+    """
+    try:
+        value, _ = _DECODER.raw_decode(text[start:start + max_length].lstrip())
+    except ValueError:
+        return None
+    return value
+
+
+def extract_json(text: str, marker: re.Pattern, pattern: re.Pattern, use_scanner: bool = False) -> Any:
+    """Decoded JSON embedded in text, found either with the scanner after marker or with pattern."""
+    if not text:
+        return None
+    with METRICS.timer("json_extract_seconds", method="scanner" if use_scanner else "regex"):
+        if use_scanner:
+            match = marker.search(text)
+            return scan_json(text, match.end()) if match else None
+        match = pattern.search(text)
+        return jsonlib.loads(match.group(1)) if match else None
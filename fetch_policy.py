@@ -0,0 +1,142 @@
+from typing import Dict, Any, Optional, Iterable
+from email.utils import parsedate_to_datetime
+import random
+import time
+
+
+class FetchError(Exception):
+    """A fetch that failed for good: HTTP error status, timeout, connection error or open circuit.
+
+    retryable tells callers (the crawl engine) whether trying again later
+    could help; errors raised after the policy used up its own retries are
+    not retryable. CircuitOpenError is, once the breaker lets requests through.
+    """
+
+    def __init__(self, message: str, url: str = None, status: Optional[int] = None, retryable: bool = False):
+        super().__init__(message)
+        self.url = url
+        self.status = status
+        self.retryable = retryable
+
+
+class CircuitOpenError(FetchError):
+    """The host's breaker is shedding requests. Retryable: ask again after retry_in seconds."""
+
+    def __init__(self, message: str, url: str = None, retry_in: float = 0.0):
+        super().__init__(message, url=url, retryable=True)
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Per-host breaker: opens after failure_threshold consecutive failures, sheds requests
+    for reset_timeout seconds, then lets a single trial request through (half-open)."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def retry_in(self) -> float:
+        """Seconds until a rejected request is worth trying again."""
+        if self.opened_at is None:
+            return 0.0
+        remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+        # half-open with the trial still out: check back once it had time to answer
+        return remaining if remaining > 0 else min(1.0, self.reset_timeout)
+
+    def release_trial(self):
+        """The trial request ended without an answer (e.g. cancelled); let the next one try."""
+        self.trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        # a failed trial reopens; requests already in flight when it opened don't extend the wait
+        if self.trial_in_flight or (self.opened_at is None and self.failures >= self.failure_threshold):
+            self.times_opened += 1
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+
+class FetchPolicy:
+    """Timeouts, retries and circuit breaking for HttpClient.fetch.
+
+    Every attempt gets request_timeout (connect_timeout for the connection),
+    and the whole fetch including retries and backoff is cut off at
+    total_timeout, so one slow page can't hold a worker for longer than that.
+    Retries use full-jitter exponential backoff, or the server's Retry-After
+    when it asks for longer.
+    """
+
+    def __init__(self, request_timeout: float = 30.0, connect_timeout: float = 10.0,
+                 total_timeout: Optional[float] = 90.0, max_attempts: int = 3,
+                 backoff: float = 0.5, max_backoff: float = 10.0, max_retry_after: float = 60.0,
+                 retry_statuses: Iterable[int] = (429, 500, 502, 503, 504),
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self.total_timeout = total_timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = set(retry_statuses)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        asked = parse_retry_after(retry_after)
+        if asked is not None:
+            delay = max(delay, min(asked, self.max_retry_after))
+        return delay
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "open_circuits": [host for host, b in self.breakers.items() if b.state != "closed"],
+            "circuits_opened": sum(b.times_opened for b in self.breakers.values()),
+        }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,164 @@
+"""Recorded page fixtures and an offline replay of them, for benchmarks that never touch the live sites.
+
+The archive is gzip-compressed JSON lines, one response per line:
+{"url", "status", "headers", "body"}. Later records for the same url win.
+
+HTTP scrapers are pointed at ReplayServer by HttpClient's url_rewriter; the
+browser scraper gets BrowserReplay, which answers its page requests through
+pyppeteer request interception instead.
+"""
+from typing import Dict, Any, Optional, Callable
+from urllib.parse import urlsplit, quote
+import asyncio
+import gzip
+import os
+import random
+
+from aiohttp import web
+
+import jsonlib
+
+# response headers worth replaying; the rest (dates, cookies, CDN ids) only add noise
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control")
+
+
+class FixtureArchive:
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+        self.records = 0
+
+    def record(self, url: str, status: int, headers: Dict[str, str], body: str):
+        if self.file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.file = gzip.open(self.path, "ab")
+        # pyppeteer lowercases header names, aiohttp keeps the server's spelling
+        lowered = {k.lower(): v for k, v in headers.items()}
+        kept = {k: lowered[k.lower()] for k in KEPT_HEADERS if k.lower() in lowered}
+        self.file.write(jsonlib.dumps_bytes({"url": url, "status": status, "headers": kept, "body": body}))
+        self.file.write(b"\n")
+        self.records += 1
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        responses = {}
+        with gzip.open(self.path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    record = jsonlib.loads(line)
+                    responses[record["url"]] = record
+        return responses
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def rewrite_to(base: str) -> Callable[[str], str]:
+    """url_rewriter for HttpClient: https://host/path?q -> {base}/https/host/path?q on the replay server."""
+    def rewrite(url: str) -> str:
+        parts = urlsplit(url)
+        rewritten = f"{base}/{parts.scheme}/{parts.netloc}{quote(parts.path or '/')}"
+        return f"{rewritten}?{parts.query}" if parts.query else rewritten
+    return rewrite
+
+
+class ReplayServer:
+    """aiohttp app serving archived responses with injected latency, jitter and errors."""
+
+    def __init__(self, responses: Dict[str, Dict[str, Any]], latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0.0, seed: Optional[int] = None):
+        self.responses = responses
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.stats = {"served": 0, "injected_errors": 0, "missing": 0}
+
+    def delay(self) -> float:
+        return max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    async def handle(self, request: web.Request) -> web.Response:
+        # match_info is already percent-decoded once, undoing rewrite_to's quote()
+        scheme, _, rest = request.match_info["tail"].partition("/")
+        url = f"{scheme}://{rest}"
+        if request.rel_url.raw_query_string:
+            url = f"{url}?{request.rel_url.raw_query_string}"
+        await asyncio.sleep(self.delay())
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats["injected_errors"] += 1
+            return web.Response(status=503, text="injected error")
+        record = self.responses.get(url)
+        if record is None:
+            self.stats["missing"] += 1
+            return web.Response(status=404, text=f"not in fixtures: {url}")
+        self.stats["served"] += 1
+        headers = dict(record["headers"])
+        content_type = headers.pop("Content-Type", "text/html; charset=utf-8")
+        response = web.Response(status=record["status"], text=record["body"], headers=headers)
+        response.headers["Content-Type"] = content_type
+        return response
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", self.handle)
+        return app
+
+
+def serve_replay(path: str, options: Dict[str, Any], ready, stop):
+    """Process entry point: serve the archive on a free port, send the base url through ready, run until stop is set."""
+    async def run():
+        server = ReplayServer(FixtureArchive(path).load(), **options)
+        runner = web.AppRunner(server.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        ready.put(f"http://127.0.0.1:{port}")
+        while not stop.is_set():
+            await asyncio.sleep(0.1)
+        ready.put(server.stats)
+        await runner.cleanup()
+    asyncio.run(run())
+
+
+class BrowserReplay:
+    """Answers a pyppeteer page's requests from the archive. Same attach(page) hook as ResourceBlocker.
+
+    Documents and XHRs found in the archive are fulfilled (after the injected
+    latency), everything else is aborted, so the browser never goes online.
+    """
+
+    def __init__(self, responses: Dict[str, Dict[str, Any]], latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0.0, seed: Optional[int] = None):
+        self.server = ReplayServer(responses, latency_ms, jitter_ms, error_rate, seed)
+
+    async def attach(self, page):
+        await page.setRequestInterception(True)
+        page.on('request', lambda request: asyncio.ensure_future(self._on_request(request)))
+
+    async def _on_request(self, request):
+        server = self.server
+        record = server.responses.get(request.url)
+        try:
+            if record is None:
+                if request.resourceType == 'document':
+                    server.stats["missing"] += 1
+                await request.abort()
+                return
+            await asyncio.sleep(server.delay())
+            if server.error_rate and server.random.random() < server.error_rate:
+                server.stats["injected_errors"] += 1
+                await request.respond({'status': 503, 'body': 'injected error'})
+                return
+            server.stats["served"] += 1
+            await request.respond({
+                'status': record["status"],
+                'contentType': record["headers"].get("Content-Type", "text/html; charset=utf-8"),
+                'body': record["body"],
+            })
+        except Exception as e:
+            # the request may already be handled if the page navigated away
+            print(f"Error replaying {request.url}: {e}")
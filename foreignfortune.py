@@ -1,44 +1,73 @@
 # foreignfortune.py
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional
 from parsel import Selector
-from pyppeteer import launch
+import argparse
 import asyncio
-import json
+import jsonlib
 import os
-import aiohttp
-import re
-from jsonpath_ng import parse
+from http_client import HttpClient
+from output_writer import NDJSONWriter, ndjson_to_json
+from columnar_export import ColumnarExporter
+from checkpoint import CheckpointStore
+from incremental import IncrementalStore
+from price_index import PriceIndex
+from parse_executor import ParseExecutor
+from metrics import METRICS
+from records import Product, Model, Variant
+from engine import CrawlEngine, CrawlRequest, SiteAdapter, Listing
+from discovery import iter_sitemap
+from fetch_policy import FetchError, CircuitOpenError
+from response_cache import open_cache
+from extraction import (
+    WEB_PIXELS_SCRIPT, PAGINATION_LAST_HREF, COLLECTION_VIEWED_RE, COLLECTION_VIEWED_MARKER,
+    INIT_DATA_RE, INIT_DATA_MARKER, first, extract_json,
+)
 
 class ForeignFortuneScraper:
     """Scraperr for foreignfortune.com website"""
     
-    def __init__(self):
+    def __init__(self, client: HttpClient = None, concurrency: int = 8,
+                 checkpoint: CheckpointStore = None, incremental: IncrementalStore = None,
+                 json_scanner: bool = False, parser: ParseExecutor = None, discovery: str = "sitemap",
+                 product_source: str = "json"):
         self.base_url = "https://foreignfortune.com"
+        self.client = client or HttpClient()
+        self.checkpoint = checkpoint
+        self.incremental = incremental
+        # decode embedded JSON with extraction.scan_json instead of the lazy regexes
+        self.json_scanner = json_scanner
+        self.parser = parser or ParseExecutor()
+        # crawl engine workers, i.e. the cap on pages in flight so the fan-out stays polite to the site
+        self.concurrency = concurrency
+        # "sitemap": product urls from sitemap.xml, all fetched in parallel; "pages": walk collections/all
+        self.discovery = discovery
+        # where models come from: "json" (the small /products/<handle>.js, falls back to "page")
+        # or "page" (full product HTML); collection_viewed lists one variant per product, too few for models
+        if product_source not in ("json", "page"):
+            raise ValueError(f"Unknown product source: {product_source}")
+        self.product_source = product_source
 
 
 
     async def get_page_content(self, url: str) -> str:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                return await response.text()
+        return await self.client.get_text(url)
     
     def extract_json_data(self, text):
-        pattern = r'publish\("collection_viewed",\s*(.*?)\s*\);}'
-        match = re.search(pattern, text, re.DOTALL)
-        return match.group(1) if match else None
+        return extract_json(text, COLLECTION_VIEWED_MARKER, COLLECTION_VIEWED_RE, self.json_scanner)
 
     def extract_prod_json(self, text):
-        pattern = r'isMerchantRequest: false,initData:\s*(.*?)\s*,\},function pageEvents'
-        match = re.search(pattern, text, re.DOTALL)
-        return match.group(1) if match else None
+        return extract_json(text, INIT_DATA_MARKER, INIT_DATA_RE, self.json_scanner)
 
 
+    @METRICS.timed("extract_models_seconds", site="foreignfortune")
     def extract_models(self, data):
-        data = json.loads(data)
+        if isinstance(data, str):
+            data = jsonlib.loads(data)
         variants = data.get('productVariants', [])
-        
-        color_groups = {}
-        
+
+        # one Model per color, in first-seen order
+        models = {}
+
         for variant in variants:
             if ' / ' in variant['title']:
                 size, color = variant['title'].split(' / ')
@@ -46,148 +75,319 @@ class ForeignFortuneScraper:
                 color = variant['title']
                 size = 'ONE SIZE'
 
-            
-            if color not in color_groups:
-                color_groups[color] = []
-                
-            variant_obj = {
-                'id': variant['id'],
-                'image': f"https:{variant['image']['src']}" if variant['image']['src'].startswith('//') else variant['image']['src'],
-                'price': variant['price']['amount'],
-                'size': size
-            }
-            
-            color_groups[color].append(variant_obj)
-        
-        models = [
-            {
-                'color': color,
-                'variants': variants
-            }
-            for color, variants in color_groups.items()
-        ]
-        
-        return models
+            model = models.get(color)
+            if model is None:
+                model = models[color] = Model(color=color, variants=[])
+
+            model.variants.append(Variant(
+                id=variant['id'],
+                image=f"https:{variant['image']['src']}" if variant['image']['src'].startswith('//') else variant['image']['src'],
+                price=variant['price']['amount'],
+                size=size,
+            ))
+
+        return list(models.values())
 
         
 
-    def parse_product(self, selector: Selector, meta) -> Dict[str, Any]:
+    @METRICS.timed("parse_product_seconds", site="foreignfortune")
+    def parse_product(self, selector: Selector, meta) -> Product:
 
-        prod_data = selector.xpath("//script[@id='web-pixels-manager-setup']/text()").get()
+        prod_data = first(WEB_PIXELS_SCRIPT, selector.root)
         prod_data = self.extract_prod_json(prod_data)
-        id = meta['id']
 
         variants_data = self.extract_models(prod_data)
 
-        product = {
-            "id": id,
-            "title": meta['title'],
-            "image" : meta['image'],
-            "price": meta['price'],
-            "description": meta["title"],
-            "sales_prices": meta['sales_prices'],
-            "prices": meta["prices"],
-            "images": meta['images'],
-            "url": meta['url'],
-            "brand": meta['brand'],
-            "models": variants_data
+        return self.build_product(meta, variants_data)
+
+    def build_product(self, meta: Dict[str, Any], models: List[Model]) -> Product:
+        return Product(
+            id=meta['id'],
+            title=meta['title'],
+            image=meta['image'],
+            price=meta['price'],
+            description=meta["title"],
+            sales_prices=meta['sales_prices'],
+            prices=meta["prices"],
+            images=meta['images'],
+            url=meta['url'],
+            brand=meta['brand'],
+            models=models,
+        )
+
+    def product_json_url(self, url: str) -> str:
+        # Shopify's storefront JSON for one product: every variant, a few KB instead of the full page
+        return f"{url.split('?')[0].rstrip('/')}.js"
+
+    def parse_product_json(self, text: str, meta: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Record from /products/<handle>.js. Sitemap products (no listing meta) take theirs from it too."""
+        try:
+            data = jsonlib.loads(text)
+            # same shape as initData's productVariants (ids as strings), prices in cents there
+            variants = [
+                {
+                    'id': str(variant['id']),
+                    'title': variant['title'],
+                    'image': {'src': (variant.get('featured_image') or {}).get('src') or data['featured_image']},
+                    'price': {'amount': variant['price'] / 100},
+                }
+                for variant in data['variants']
+            ]
+            if 'id' not in meta:
+                first_variant = variants[0]
+                price = first_variant['price']['amount']
+                meta = {
+                    "url": meta['url'],
+                    "title": data['title'],
+                    "id": first_variant['id'],
+                    "image": first_variant['image']['src'],
+                    "price": price,
+                    "sales_prices": [price],
+                    "prices": [price],
+                    "images": [first_variant['image']['src']],
+                    "brand": data['vendor'],
+                }
+            return self.build_product(meta, self.extract_models({'productVariants': variants}))
+        except (jsonlib.JSONDecodeError, KeyError, TypeError, AttributeError, IndexError, ValueError) as e:
+            print(f"Error parsing product JSON for {meta.get('url')}: {e}")
+            return None
+
+    def page_meta(self, selector: Selector, url: str) -> Optional[Dict[str, Any]]:
+        """Listing-style meta for a product found in the sitemap, read from the page's own initData.
+
+        initData has the same variant objects as the collection_viewed payload;
+        the first one is the variant a collection page would have listed.
+        """
+        prod_data = self.extract_prod_json(first(WEB_PIXELS_SCRIPT, selector.root))
+        variants = prod_data.get('productVariants') if prod_data else None
+        if not variants:
+            return None
+        meta = self.build_meta(variants[0])
+        meta["url"] = url
+        return meta
+
+    def build_meta(self, item) -> Dict[str, Any]:
+        return {
+            "url": f"https://foreignfortune.com{item['product']['url']}",
+            "title": item['product']['title'],
+            "id": item['id'],
+            "image": item['image']['src'],
+            "price": item['price']['amount'],
+            "sales_prices": [item['price']['amount']],
+            "prices": [item['price']['amount']],
+            "images": [item['image']['src']],
+            "brand": item['product']['vendor'],
         }
-        
-          
-        return product
-    
 
+    def collection_url(self, page: int) -> str:
+        base_collection_url = "https://foreignfortune.com/collections/all"
+        return f"{base_collection_url}?page={page}" if page > 1 else base_collection_url
+
+    def sitemap_url(self) -> str:
+        return f"{self.base_url}/sitemap.xml"
 
     async def scrape(self) -> List[Dict[str, Any]]:
-        base_collection_url = "https://foreignfortune.com/collections/all"
-        products = []
-        page = 1
-        
-        while True:
-            collection_url = f"{base_collection_url}?page={page}" if page > 1 else base_collection_url
-            print(f"Scraping page {page}: {collection_url}")
-            
-            content = await self.get_page_content(collection_url)
-            selector = Selector(text=content)
-            
-            product_urls = selector.xpath("//script[@id='web-pixels-manager-setup']/text()").get()
-            
-            if not product_urls:
-                print(f"No products found on page {page}. Stopping pagination.")
-                break
-                
+        return [product async for product in self.iter_products()]
+
+    def engine(self, **options) -> CrawlEngine:
+        return CrawlEngine(ForeignFortuneSite(self), client=self.client, concurrency=self.concurrency,
+                           checkpoint=self.checkpoint, incremental=self.incremental, parser=self.parser,
+                           **options)
+
+    async def iter_products(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yields products as they are parsed, see output_writer.NDJSONWriter."""
+        engine = self.engine()
+        async for product in engine.iter_products():
+            yield product
+        print(f"Total products scraped: {engine.stats['products']}")
+        print(f"Crawl stats: {engine.summary()}")
+
+
+class ForeignFortuneSite(SiteAdapter):
+    """Collection pages list every product variant with its listing data, one product page per variant."""
+
+    name = "foreignfortune"
+
+    def __init__(self, scraper: ForeignFortuneScraper):
+        self.scraper = scraper
+        # products built per source, "page" counting the fallbacks too
+        self.sources = {"json": 0, "page": 0}
+
+    def seeds(self):
+        yield self.scraper.collection_url(1), {"page": 1}
+
+    async def discover(self, engine: CrawlEngine):
+        if self.scraper.discovery != "sitemap":
+            return
+        # Shopify's index also lists pages, collections and blogs sitemaps
+        async for url, _ in iter_sitemap(engine.client, self.scraper.sitemap_url(),
+                                         include=lambda loc: "/products/" in loc,
+                                         include_sitemap=lambda loc: "sitemap_products" in loc):
+            yield url, {"url": url}
+
+    def parse_listing(self, url: str, html: str, meta: Dict[str, Any]) -> Listing:
+        page = meta["page"]
+        selector = Selector(text=html)
+        product_urls = first(WEB_PIXELS_SCRIPT, selector.root)
+        if not product_urls:
+            print(f"No products found on page {page}. Stopping pagination.")
+            return Listing()
+
+        try:
+            data = self.scraper.extract_json_data(product_urls)
+            collection = data["collection"]["productVariants"]
+        except (jsonlib.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"Error parsing data on page {page}: {e}")
+            return Listing()
+
+        listing = Listing()
+        for item in collection:
+            meta_info = self.scraper.build_meta(item)
+            listing.products.append((meta_info["url"], meta_info))
+
+        next_page = first(PAGINATION_LAST_HREF, selector.root)
+        if next_page and f"page={page + 1}" in next_page:
+            listing.next_pages.append((self.scraper.collection_url(page + 1), {"page": page + 1}))
+        else:
+            print(f"No more pages found after page {page}")
+        return listing
+
+    def product_key(self, url: str, meta: Dict[str, Any]) -> str:
+        # one record per variant id, variants of a product share the url; sitemap products have no id yet
+        return str(meta["id"]) if "id" in meta else url
+
+    async def product(self, engine: CrawlEngine, request: CrawlRequest) -> Optional[Dict[str, Any]]:
+        source = self.scraper.product_source
+        product = None
+        if source == "json":
             try:
-                data = self.extract_json_data(product_urls)
-                data = json.loads(data)
-                collection = data["collection"]["productVariants"]
-            except (json.JSONDecodeError, KeyError) as e:
-                print(f"Error parsing data on page {page}: {e}")
-                break
-                
-
-            for item in collection:
-                try:
-                    url = item['product']['url']
-                    title = item['product']['title']
-                    id = item['id']
-                    image = item['image']['src']
-                    price = item['price']['amount']
-                    sales_prices = [item['price']['amount']]
-                    prices = [item['price']['amount']]
-                    images = [item['image']['src']]
-                    brand = item['product']['vendor']
-                    
-                    url = f"https://foreignfortune.com{url}"
-                    meta_info = {
-                        "url": url,
-                        "title": title,
-                        "id": id,
-                        "image": image,
-                        "price": price,
-                        "sales_prices": sales_prices,
-                        "prices": prices,
-                        "images": images,
-                        "brand": brand,
-                    }
-
-
-                    prod_content = await self.get_page_content(url)
-                    prod_selector = Selector(text=prod_content)
-                    
-                    product = self.parse_product(prod_selector, meta=meta_info)
-                    products.append(product)
-                    
-                except Exception as e:
-                    print(f"Error processing product on page {page}: {e}")
-                    continue
-            
-
-            next_page = selector.xpath("//ul[@class='list--inline pagination']/li[last()]/a/@href").get()
-            if not next_page or f"page={page + 1}" not in next_page:
-                print(f"No more pages found after page {page}")
-                break
-                
-            await asyncio.sleep(2)
-            page += 1
-        
-        print(f"Total products scraped: {len(products)}")
-        return products     
-        
+                product = await engine.fetch_product(
+                    request, self.scraper.product_json_url(request.url),
+                    (parse_product_json, (request.meta,)),
+                )
+            except CircuitOpenError:
+                # the whole host is shedding load, the page would be refused too
+                raise
+            except FetchError as e:
+                print(f"No product JSON for {request.url} ({e}), fetching the page")
+        if product is None:
+            source = "page"
+            product = await engine.fetch_product(request)
+        self.sources[source] += 1
+        METRICS.inc("product_source_total", site=self.name, source=source)
+        return product
+
+    def summary(self) -> Dict[str, Any]:
+        return {"product_sources": dict(self.sources)}
+
+    def parse_task(self, request: CrawlRequest):
+        if "id" not in request.meta:
+            return parse_product_page_html, (request.url, self.scraper.json_scanner)
+        return parse_product_html, (request.meta, self.scraper.json_scanner)
+
+
+_parsers = {}
+
+
+def parse_product_html(html: str, meta, json_scanner: bool = False) -> Dict[str, Any]:
+    """Module-level (picklable) entry point for ParseExecutor workers."""
+    parser = _parsers.get(json_scanner)
+    if parser is None:
+        parser = _parsers[json_scanner] = ForeignFortuneScraper(json_scanner=json_scanner)
+    return parser.parse_product(Selector(text=html), meta=meta)
+
+
+def parse_product_json(text: str, meta: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    parser = _parsers.get(False)
+    if parser is None:
+        parser = _parsers[False] = ForeignFortuneScraper()
+    return parser.parse_product_json(text, meta)
+
+
+def parse_product_page_html(html: str, url: str, json_scanner: bool = False) -> Optional[Dict[str, Any]]:
+    """Like parse_product_html for sitemap products, which come without listing meta."""
+    parser = _parsers.get(json_scanner)
+    if parser is None:
+        parser = _parsers[json_scanner] = ForeignFortuneScraper(json_scanner=json_scanner)
+    selector = Selector(text=html)
+    meta = parser.page_meta(selector, url)
+    return parser.parse_product(selector, meta=meta) if meta else None
 
 
 def save_output(products: List[Dict[str, Any]]):
         os.makedirs("output", exist_ok=True)
-        with open("output/foreignfortune.json", "a") as f:
-            json.dump(products, f, indent=2)
+        with open("output/foreignfortune.json", "wb") as f:
+            f.write(jsonlib.dumps_bytes(products, indent=2))
 
 
-async def main():
-    ff_scraper = ForeignFortuneScraper()
-    ff_products = await ff_scraper.scrape()
-    # print(ff_products)
-    save_output(ff_products)
+async def main(resume: bool = False, incremental: bool = False, parse_workers: int = 0,
+               parse_mode: str = "thread", columnar: Optional[str] = None,
+               concurrency: int = 8, discovery: str = "sitemap", product_source: str = "json",
+               cache: Optional[str] = None, offline: bool = False, changes: bool = False,
+               status: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Full run into output/foreignfortune.*; returns the crawl summary. status["engine"] exposes live progress."""
+    checkpoint = CheckpointStore(site="foreignfortune")
+    if not resume:
+        checkpoint.clear()
+    store = IncrementalStore(site="foreignfortune") if incremental else None
+    response_cache = open_cache(cache, offline)
+    async with HttpClient(cache=response_cache) as client:
+        parser = ParseExecutor(workers=parse_workers, mode=parse_mode)
+        ff_scraper = ForeignFortuneScraper(client=client, concurrency=concurrency, checkpoint=checkpoint,
+                                           incremental=store, parser=parser, discovery=discovery,
+                                           product_source=product_source)
+        exporter = ColumnarExporter(columnar, site="foreignfortune") if columnar else None
+        index = PriceIndex(site="foreignfortune", changes_path="output/foreignfortune_changes.ndjson") if changes else None
+        try:
+            with NDJSONWriter("output/foreignfortune.ndjson") as writer:
+                engine = ff_scraper.engine(sinks=[writer] + [sink for sink in (exporter, index) if sink])
+                if status is not None:
+                    status["engine"] = engine
+                await engine.run()
+            summary = engine.summary()
+            if index:
+                index.finish(remove_missing=not resume and not summary["failed"] and not summary["sink_errors"])
+                print(f"Price index: {index.summary()}")
+        finally:
+            # also when the crawl failed: a Parquet part is unreadable until its footer is written
+            if exporter:
+                exporter.close()
+            if index:
+                index.close()
+        print(f"Total products scraped: {summary['products']}, by source: {summary['product_sources']}")
+        print(f"HTTP stats: {client.summary()}")
+        parser.close()
+    print(f"Checkpoint: {checkpoint.summary()}")
+    checkpoint.close()
+    if store:
+        print(f"Incremental: {store.summary()}")
+        store.close()
+    if response_cache:
+        response_cache.close()
+    ndjson_to_json("output/foreignfortune.ndjson", "output/foreignfortune.json")
     print("Output saved")
+    return summary
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Scrape foreignfortune.com")
+    parser.add_argument("--resume", action="store_true", help="skip pages and products already in the checkpoint")
+    parser.add_argument("--incremental", action="store_true",
+                        help="send conditional requests and reuse last run's record for unchanged pages")
+    parser.add_argument("--parse-workers", type=int, default=0, help="parse in a worker pool (0 parses on the event loop)")
+    parser.add_argument("--parse-mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--columnar", metavar="DIR", help="also append products/models/variants Parquet tables under DIR")
+    parser.add_argument("--discovery", choices=["sitemap", "pages"], default="sitemap",
+                        help="find products in sitemap.xml (falls back to pages) or by walking collections/all")
+    parser.add_argument("--product-source", choices=["json", "page"], default="json",
+                        help="build models from /products/<handle>.js (falls back to the page) or the full page")
+    parser.add_argument("--cache", metavar="DIR", help="keep responses in an on-disk cache under DIR (24h TTL)")
+    parser.add_argument("--offline", action="store_true", help="serve only from the response cache, never the network")
+    parser.add_argument("--changes", action="store_true",
+                        help="upsert into output/price_index.sqlite and write only new, removed and price-changed "
+                             "products to output/foreignfortune_changes.ndjson")
+    args = parser.parse_args()
+    asyncio.run(main(resume=args.resume, incremental=args.incremental,
+                     parse_workers=args.parse_workers, parse_mode=args.parse_mode,
+                     columnar=args.columnar, discovery=args.discovery, product_source=args.product_source,
+                     cache=args.cache, offline=args.offline, changes=args.changes))
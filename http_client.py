@@ -0,0 +1,349 @@
+from typing import Dict, Any, Optional, Callable, AsyncIterator
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+import asyncio
+import time
+import aiohttp
+
+from fetch_policy import FetchPolicy, FetchError, CircuitOpenError
+from metrics import METRICS
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status: int
+    text: str
+    headers: Dict[str, str] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+
+class HttpClient:
+    """Shared aiohttp session with keep-alive pooling, used by all the aiohttp scrapers.
+
+    One session lives for the whole run, so the TCP/TLS handshake and the DNS lookup
+    are paid once per host instead of once per product page.
+    """
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None, limit: int = 100,
+                 limit_per_host: int = 10, dns_ttl: int = 300, keepalive_timeout: float = 30.0,
+                 rate_limiter=None, max_in_flight: Optional[int] = None,
+                 url_rewriter: Optional[Callable[[str], str]] = None, recorder=None,
+                 policy: Optional[FetchPolicy] = None, cache=None):
+        self.headers = headers or {}
+        self.policy = policy or FetchPolicy()
+        # response_cache.ResponseCache: 200 responses are served from disk until they expire
+        self.cache = cache
+        # offline runs: send requests to fixtures.ReplayServer while results keep the original url
+        self.url_rewriter = url_rewriter
+        # fixtures.FixtureArchive (or anything with record()) that keeps every response
+        self.recorder = recorder
+        self.rate_limiter = rate_limiter
+        # global cap on requests in flight, across every task sharing this client
+        self.in_flight = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+        self.started_at = None
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.session = None
+        self.stats = {
+            "requests": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "dns_lookups": 0,
+            "dns_cache_hits": 0,
+            "request_time": 0.0,
+            "connect_time": 0.0,
+            "dns_time": 0.0,
+            "retries": 0,
+            "timeouts": 0,
+            "http_errors": 0,
+            "circuit_rejections": 0,
+            "cache_hits": 0,
+        }
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_conn_start(session, ctx, params):
+            ctx.conn_start = time.perf_counter()
+
+        async def on_conn_end(session, ctx, params):
+            elapsed = time.perf_counter() - ctx.conn_start
+            self.stats["connections_created"] += 1
+            self.stats["connect_time"] += elapsed
+            # TCP + TLS handshake
+            METRICS.observe("http_connect_seconds", elapsed)
+
+        async def on_conn_reuse(session, ctx, params):
+            self.stats["connections_reused"] += 1
+
+        async def on_dns_start(session, ctx, params):
+            ctx.dns_start = time.perf_counter()
+
+        async def on_dns_end(session, ctx, params):
+            elapsed = time.perf_counter() - ctx.dns_start
+            self.stats["dns_lookups"] += 1
+            self.stats["dns_time"] += elapsed
+            METRICS.observe("http_dns_seconds", elapsed, host=params.host)
+
+        async def on_dns_hit(session, ctx, params):
+            self.stats["dns_cache_hits"] += 1
+
+        async def on_request_start(session, ctx, params):
+            ctx.request_start = time.perf_counter()
+
+        async def on_request_end(session, ctx, params):
+            # fires once the response headers are in: connection setup plus server time, no body
+            METRICS.observe("http_ttfb_seconds", time.perf_counter() - ctx.request_start, host=params.url.host)
+
+        trace.on_connection_create_start.append(on_conn_start)
+        trace.on_connection_create_end.append(on_conn_end)
+        trace.on_connection_reuseconn.append(on_conn_reuse)
+        trace.on_dns_resolvehost_start.append(on_dns_start)
+        trace.on_dns_resolvehost_end.append(on_dns_end)
+        trace.on_dns_cache_hit.append(on_dns_hit)
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        return trace
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                use_dns_cache=True,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self.session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=connector,
+                trace_configs=[self._trace_config()],
+            )
+        return self.session
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        """GET url under the fetch policy. Returns 2xx/3xx results (304 included), raises FetchError otherwise."""
+        if self.cache is not None:
+            cached = self._cached(url)
+            if cached is not None:
+                return FetchResult(url=url, status=cached.status, text=cached.text, headers=cached.headers)
+        policy = self.policy
+        host = urlsplit(url).netloc
+        breaker = policy.breaker(host)
+        deadline = time.monotonic() + policy.total_timeout if policy.total_timeout else None
+        attempt = 0
+        while True:
+            attempt += 1
+            trial = self._allow(breaker, host, url)
+            timeout = policy.request_timeout
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+            retry_after = None
+            try:
+                if deadline is None:
+                    result = await self._attempt(url, headers, timeout)
+                else:
+                    # the deadline covers the waits for the rate limiter and the in-flight cap too
+                    result = await asyncio.wait_for(self._attempt(url, headers, timeout),
+                                                    max(deadline - time.monotonic(), 0.001))
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                breaker.record_failure()
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats["timeouts"] += 1
+                reason = type(e).__name__
+                error = FetchError(f"{reason} fetching {url}", url=url)
+            else:
+                if result.status < 400:
+                    breaker.record_success()
+                    if self.cache is not None and result.status == 200:
+                        self.cache.put(url, result.status, result.headers, result.text.encode("utf-8"))
+                    return result
+                self.stats["http_errors"] += 1
+                reason = str(result.status)
+                error = FetchError(f"HTTP {result.status} for {url}", url=url, status=result.status)
+                if result.status not in policy.retry_statuses:
+                    # the site answered fine, this page is just missing or forbidden
+                    breaker.record_success()
+                    raise error
+                breaker.record_failure()
+                retry_after = result.headers.get("Retry-After")
+            finally:
+                # a cancelled (or otherwise aborted) trial must not leave the circuit half-open for good
+                if trial:
+                    breaker.release_trial()
+
+            if attempt >= policy.max_attempts:
+                raise error
+            delay = policy.retry_delay(attempt, retry_after)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise error
+            self.stats["retries"] += 1
+            METRICS.inc("http_retries_total", host=host, reason=reason)
+            await asyncio.sleep(delay)
+
+    async def _attempt(self, url: str, headers: Optional[Dict[str, str]], timeout: float) -> FetchResult:
+        if self.in_flight is None:
+            return await self._fetch(url, headers, timeout)
+        async with self.in_flight:
+            return await self._fetch(url, headers, timeout)
+
+    async def _fetch(self, url: str, headers: Optional[Dict[str, str]], timeout: float) -> FetchResult:
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
+        session = self._get_session()
+        if self.started_at is None:
+            self.started_at = time.perf_counter()
+        start = time.perf_counter()
+        host = urlsplit(url).hostname
+        target = self.url_rewriter(url) if self.url_rewriter else url
+        client_timeout = aiohttp.ClientTimeout(total=max(timeout, 0.001), sock_connect=self.policy.connect_timeout)
+        try:
+            async with session.get(target, headers=headers, timeout=client_timeout) as response:
+                # a body that doesn't match its declared charset still parses, bad bytes become U+FFFD
+                text = await response.text(errors="replace")
+                elapsed = time.perf_counter() - start
+                host = response.url.host
+                # read() hands back the body text() already buffered
+                METRICS.observe("http_response_bytes", len(await response.read()), host=host)
+                METRICS.inc("http_responses_total", host=host, status=response.status)
+                if self.rate_limiter:
+                    self.rate_limiter.record(elapsed, response.status)
+                if self.recorder:
+                    self.recorder.record(url, response.status, dict(response.headers), text)
+                return FetchResult(
+                    url=url,
+                    status=response.status,
+                    text=text,
+                    headers=dict(response.headers),
+                    elapsed=elapsed,
+                )
+        finally:
+            # timed out and failed attempts were sent too
+            elapsed = time.perf_counter() - start
+            self.stats["requests"] += 1
+            self.stats["request_time"] += elapsed
+            METRICS.observe("http_request_seconds", elapsed, host=host)
+
+    async def iter_bytes(self, url: str, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """Stream a response body (e.g. a large sitemap) in chunks instead of buffering it.
+
+        A stream can't be replayed halfway through, so it gets a single attempt:
+        the breaker and timeouts apply, retries are left to the caller.
+        """
+        if self.cache is not None:
+            cached = self._cached(url)
+            if cached is not None:
+                yield cached.body
+                return
+        policy = self.policy
+        host = urlsplit(url).netloc
+        breaker = policy.breaker(host)
+        trial = self._allow(breaker, host, url)
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
+        session = self._get_session()
+        if self.started_at is None:
+            self.started_at = time.perf_counter()
+        start = time.perf_counter()
+        target = self.url_rewriter(url) if self.url_rewriter else url
+        # sock_read bounds each stall between chunks, total bounds the whole download
+        timeout = aiohttp.ClientTimeout(total=policy.total_timeout, sock_connect=policy.connect_timeout,
+                                        sock_read=policy.request_timeout)
+        size = 0
+        body = [] if self.recorder or self.cache is not None else None
+        try:
+            async with session.get(target, timeout=timeout) as response:
+                METRICS.inc("http_responses_total", host=host, status=response.status)
+                if response.status >= 400:
+                    if response.status in policy.retry_statuses:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    self.stats["http_errors"] += 1
+                    raise FetchError(f"HTTP {response.status} for {url}", url=url, status=response.status)
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    size += len(chunk)
+                    if body is not None:
+                        body.append(chunk)
+                    yield chunk
+                breaker.record_success()
+                if body is not None:
+                    body = b"".join(body)
+                    if self.cache is not None and response.status == 200:
+                        self.cache.put(url, response.status, dict(response.headers), body)
+                    if self.recorder:
+                        self.recorder.record(url, response.status, dict(response.headers),
+                                             body.decode(response.get_encoding(), errors="replace"))
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            breaker.record_failure()
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["timeouts"] += 1
+            raise FetchError(f"{type(e).__name__} streaming {url}", url=url) from e
+        finally:
+            if trial:
+                breaker.release_trial()
+            elapsed = time.perf_counter() - start
+            self.stats["requests"] += 1
+            self.stats["request_time"] += elapsed
+            METRICS.observe("http_request_seconds", elapsed, host=host)
+            METRICS.observe("http_response_bytes", size, host=host)
+
+    def _allow(self, breaker, host: str, url: str) -> bool:
+        """Pass the breaker or raise CircuitOpenError; True when this request is the half-open trial."""
+        trial = breaker.state == "half-open"
+        if not breaker.allow():
+            self.stats["circuit_rejections"] += 1
+            METRICS.inc("http_circuit_rejections_total", host=host)
+            raise CircuitOpenError(f"Circuit open for {host}, not fetching {url}", url=url,
+                                   retry_in=breaker.retry_in())
+        return trial
+
+    def _cached(self, url: str):
+        try:
+            cached = self.cache.get(url)
+        except LookupError as e:
+            # offline and not cached: nothing else may go to the network
+            raise FetchError(str(e), url=url) from e
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            METRICS.inc("http_cache_hits_total", host=urlsplit(url).netloc)
+        return cached
+
+    async def get_text(self, url: str) -> str:
+        result = await self.fetch(url)
+        return result.text
+
+    def summary(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        requests = stats["requests"] or 1
+        stats["avg_request_time"] = stats["request_time"] / requests
+        stats["avg_connect_time"] = stats["connect_time"] / max(stats["connections_created"], 1)
+        # every reused connection skipped one handshake
+        stats["handshake_time_saved"] = stats["avg_connect_time"] * stats["connections_reused"]
+        if self.started_at is not None:
+            wall = time.perf_counter() - self.started_at
+            stats["wall_time"] = wall
+            stats["requests_per_second"] = stats["requests"] / wall if wall else 0.0
+        if self.rate_limiter:
+            stats.update(self.rate_limiter.summary())
+        stats.update(self.policy.summary())
+        if self.cache is not None:
+            stats["cache"] = self.cache.summary()
+        return stats
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+            # give the connector a tick to close the underlying SSL transports
+            await asyncio.sleep(0)
+        self.session = None
+
+    async def __aenter__(self):
+        self._get_session()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
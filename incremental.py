@@ -0,0 +1,115 @@
+from typing import Dict, Any, Callable, Optional
+import hashlib
+import inspect
+import json
+import jsonlib
+import os
+import sqlite3
+
+
+class IncrementalStore:
+    """Per-url validators (ETag, Last-Modified, body hash) and the record parsed last time.
+
+    Lets a nightly run send conditional requests and skip parse_product for
+    pages that did not change.
+    """
+
+    def __init__(self, path: str = "output/incremental.sqlite", site: str = "default"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.site = site
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "site TEXT, url TEXT, etag TEXT, last_modified TEXT, body_hash TEXT, meta_hash TEXT, record TEXT, "
+            "PRIMARY KEY (site, url))"
+        )
+        self.conn.commit()
+        self.stats = {"not_modified": 0, "hash_unchanged": 0, "changed": 0, "new": 0}
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT etag, last_modified, body_hash, meta_hash, record FROM pages WHERE site = ? AND url = ?",
+            (self.site, url),
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, body_hash, meta_hash, record = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "body_hash": body_hash,
+            "meta_hash": meta_hash,
+            "record": jsonlib.loads(record) if record else None,
+        }
+
+    def conditional_headers(self, previous: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        headers = {}
+        if previous and previous["record"] is not None:
+            if previous["etag"]:
+                headers["If-None-Match"] = previous["etag"]
+            if previous["last_modified"]:
+                headers["If-Modified-Since"] = previous["last_modified"]
+        return headers
+
+    def save(self, url: str, etag: Optional[str], last_modified: Optional[str], body_hash: str,
+             meta_hash: str, record: Optional[Dict[str, Any]]):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages (site, url, etag, last_modified, body_hash, meta_hash, record) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self.site, url, etag, last_modified, body_hash, meta_hash,
+             jsonlib.dumps(record) if record is not None else None),
+        )
+        self.conn.commit()
+
+    def summary(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        total = sum(self.stats.values())
+        hits = stats["not_modified"] + stats["hash_unchanged"]
+        stats["hit_rate"] = round(hits / total, 3) if total else 0.0
+        stats["conditional_hit_rate"] = round(stats["not_modified"] / total, 3) if total else 0.0
+        return stats
+
+    def close(self):
+        self.conn.close()
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+async def fetch_incremental(client, store: IncrementalStore, url: str,
+                            parse: Callable[[str], Any],
+                            meta: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Fetch url conditionally and only call parse when the page actually changed.
+
+    parse may return an awaitable (e.g. a ParseExecutor job). meta is whatever
+    else the record is built from (e.g. listing data); a change there forces a
+    reparse even if the page itself is unchanged.
+    """
+    previous = store.get(url)
+    meta_hash = _hash(json.dumps(meta, sort_keys=True, default=str))
+    if previous and previous["meta_hash"] != meta_hash:
+        previous["record"] = None
+    result = await client.fetch(url, headers=store.conditional_headers(previous))
+
+    if result.status == 304 and previous and previous["record"] is not None:
+        store.stats["not_modified"] += 1
+        return previous["record"]
+
+    body_hash = _hash(result.text)
+    etag = result.headers.get("ETag")
+    last_modified = result.headers.get("Last-Modified")
+    if previous and previous["body_hash"] == body_hash and previous["record"] is not None:
+        store.stats["hash_unchanged"] += 1
+        store.save(url, etag, last_modified, body_hash, meta_hash, previous["record"])
+        return previous["record"]
+
+    store.stats["changed" if previous else "new"] += 1
+    record = parse(result.text)
+    if inspect.isawaitable(record):
+        record = await record
+    store.save(url, etag, last_modified, body_hash, meta_hash, record)
+    return record
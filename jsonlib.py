@@ -0,0 +1,88 @@
+"""Pluggable JSON backend: orjson, then msgspec, then the stdlib json module.
+
+Set SCRAPER_JSON_BACKEND=json (or orjson / msgspec) to force one.
+"""
+from typing import Any, Optional, Union
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _pick_backend() -> str:
+    forced = os.environ.get("SCRAPER_JSON_BACKEND")
+    if forced:
+        return forced
+    if orjson is not None:
+        return "orjson"
+    if msgspec is not None:
+        return "msgspec"
+    return "json"
+
+
+BACKEND = _pick_backend()
+JSONDecodeError = ValueError  # orjson, msgspec and json errors all subclass ValueError
+
+_msgspec_decoder = msgspec.json.Decoder() if msgspec is not None else None
+
+
+def _default(obj):
+    to_dict = getattr(obj, "to_dict", None)
+    if to_dict is not None:
+        return to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_msgspec_encoder = msgspec.json.Encoder(enc_hook=_default) if msgspec is not None else None
+
+
+def _plain(obj):
+    """obj with every record in it, at any depth, replaced by its to_dict().
+
+    msgspec encodes dataclasses natively and never calls enc_hook for them,
+    so slotted records would come out field by field (extra included).
+    """
+    to_dict = getattr(obj, "to_dict", None)
+    if to_dict is not None:
+        return _plain(to_dict())
+    if isinstance(obj, dict):
+        return {key: _plain(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_plain(item) for item in obj]
+    return obj
+
+
+def loads(data: Union[str, bytes], backend: Optional[str] = None) -> Any:
+    backend = backend or BACKEND
+    if backend == "orjson":
+        return orjson.loads(data)
+    if backend == "msgspec":
+        return _msgspec_decoder.decode(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj: Any, indent: Optional[int] = None, backend: Optional[str] = None) -> bytes:
+    """UTF-8 JSON. Objects with a to_dict() method (records.Product) are serialized through it."""
+    backend = backend or BACKEND
+    if backend == "orjson" and indent in (None, 2):
+        # route dataclasses through _default so records serialize via to_dict()
+        option = orjson.OPT_PASSTHROUGH_DATACLASS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=_default, option=option)
+    if backend == "msgspec":
+        data = _msgspec_encoder.encode(_plain(obj))
+        return msgspec.json.format(data, indent=indent) if indent else data
+    separators = None if indent else (",", ":")
+    return json.dumps(obj, indent=indent, separators=separators, ensure_ascii=False,
+                      default=_default).encode("utf-8")
+
+
+def dumps(obj: Any, indent: Optional[int] = None, backend: Optional[str] = None) -> str:
+    return dumps_bytes(obj, indent=indent, backend=backend).decode("utf-8")
@@ -1,19 +1,46 @@
-from typing import List, Dict, Any
+from typing import Dict, Any, Optional
 from parsel import Selector
+import argparse
 import asyncio
-import aiohttp
-import json
+import jsonlib
 import os
 import logging
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlsplit, urlunsplit
 import re
+from http_client import HttpClient
+from rate_limiter import AdaptiveRateLimiter
+from output_writer import NDJSONWriter, ndjson_to_json
+from columnar_export import ColumnarExporter
+from checkpoint import CheckpointStore
+from incremental import IncrementalStore
+from price_index import PriceIndex
+from parse_executor import ParseExecutor
+from metrics import METRICS
+from records import Product, Model
+from engine import CrawlEngine, CrawlRequest, SiteAdapter, Listing
+from discovery import iter_sitemap
+from response_cache import ResponseCache, open_cache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# PrestaShop's default product route, {category/}{id}-{rewrite}.html, in the UK shop
+PRODUCT_PATH_RE = re.compile(r"^/uk/(?:[\w-]+/)*\d+-[\w-]+(?:\.html)?$")
+# PrestaShop puts id_product in front of the slug: /uk/christmas/11-truffle.html and /uk/11-truffle.html are one product
+PRODUCT_ID_RE = re.compile(r"/(\d+)-[\w-]+(?:\.html)?/?$")
+
 class ChocolateScraper:
-    def __init__(self):
+    def __init__(self, client: HttpClient = None, max_in_flight: int = 8,
+                 checkpoint: CheckpointStore = None, incremental: IncrementalStore = None,
+                 parser: ParseExecutor = None, discovery: str = "pages", cache: ResponseCache = None):
         self.base_url = "https://www.lechocolat-alainducasse.com"
+        self.checkpoint = checkpoint
+        self.incremental = incremental
+        self.parser = parser or ParseExecutor()
+        self.max_in_flight = max_in_flight
+        # "pages": the configured categories only. "sitemap" also fetches every /uk/ product in sitemap.xml,
+        # those in no category included (with categories []); the category pages are read either way
+        self.discovery = discovery
         self.categories = {
             'christmas': "/uk/christmas",
             "boxes": "/uk/chocolates",
@@ -29,12 +56,19 @@ class ChocolateScraper:
             'user-agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
             'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
         }
+        # one limiter shared by every category task, so the whole run adapts to the server
+        self.rate_limiter = AdaptiveRateLimiter(rate=2.0, burst=4)
+        self.client = client or HttpClient(
+            headers=self.headers,
+            rate_limiter=self.rate_limiter,
+            max_in_flight=max_in_flight,
+            cache=cache,
+        )
 
     async def get_page_content(self, url: str):
-        async with aiohttp.ClientSession(headers=self.headers) as session:
-            async with session.get(url) as response:
-                return await response.text()
+        return await self.client.get_text(url)
 
+    @METRICS.timed("parse_product_seconds", site="lechocolat")
     def parse_product(self, selector: Selector, url: str):
         try:
 
@@ -56,15 +90,11 @@ class ChocolateScraper:
                 if not link:
                     link = url
 
-                model = {
-                "title" : title,
-                "link" : link
-                }
-                models.append(model)
+                models.append(Model(extra={"title": title, "link": link}))
 
             prod_jsson = selector.xpath("//article[@id='product-details']/@data-product").get()
 
-            prod_json= json.loads(prod_jsson)
+            prod_json= jsonlib.loads(prod_jsson)
             available= prod_json['availability_message']
             price = prod_json['price']
             price = float(re.sub(r"[^\d.]", "", price.replace(",", "")))
@@ -72,78 +102,197 @@ class ChocolateScraper:
             id = prod_json['id_product']
             url = prod_json["link"]
 
-            product = {
-                "id": id,
-                "title": title,
-                "image":images[0],
-                "price": price,
-                "description": desc,
-                "availability": available,
-                "sales_prices": [price],
-                "prices": [price],
-                "images":images,
-                "url": url,
-                "brand": "LE CHOCOLAT",
-                "models": models,
-               
-            }
+            product = Product(
+                id=id,
+                title=title,
+                image=images[0],
+                price=price,
+                description=desc,
+                sales_prices=[price],
+                prices=[price],
+                images=images,
+                url=url,
+                brand="LE CHOCOLAT",
+                models=models,
+                extra={"availability": available},
+            )
             return product
         except Exception as e:
             logger.error(f"Error parsing product {url}: {e}")
             return None
 
 
-    async def scrape_category(self, category_url):
-        products = []
-    
-        url = category_url
-        content = await self.get_page_content(url)
-        selector = Selector(text=content)
-        
-        product_data_str = selector.xpath("//script[@type='application/ld+json'][contains(text(), 'ItemList')]/text()").get()
-        if product_data_str:
-            product_data = json.loads(product_data_str)
-
-        product_links = product_data["itemListElement"]
-        
-        print("yaha tk aaya ")
-        for d in product_links:
-            product_url = d['url']
-            product_content= await self.get_page_content(product_url)
-            product_selector = Selector(text=product_content)
-            
-            product = self.parse_product(product_selector, product_url)
-            if product:
-                products.append(product)
-            await asyncio.sleep(1)
-        
-            
-        return products
+    def sitemap_url(self) -> str:
+        return f"{self.base_url}/sitemap.xml"
+
+    def is_product_url(self, url: str) -> bool:
+        parts = urlsplit(url)
+        return parts.netloc.lower() == urlsplit(self.base_url).netloc and bool(PRODUCT_PATH_RE.match(parts.path))
 
+    def normalize_url(self, url: str) -> str:
+        parts = urlsplit(urljoin(self.base_url, url))
+        path = parts.path.rstrip("/") or "/"
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, "", ""))
 
     async def scrape(self):
-        results = {}
-        all_products = []
+        return [product async for product in self.iter_products()]
+
+    def engine(self, **options) -> CrawlEngine:
+        return CrawlEngine(LeChocolatSite(self), client=self.client, concurrency=self.max_in_flight,
+                           checkpoint=self.checkpoint, incremental=self.incremental, parser=self.parser,
+                           **options)
+
+    async def iter_products(self):
+        """Yields unique products once the crawl is done, so every product has all its categories."""
+        engine = self.engine()
+        async for product in engine.iter_products():
+            yield product
+        self.log_summary(engine)
 
-        for category_name, category_path in self.categories.items():
-            category_url = urljoin(self.base_url, category_path)
+    def log_summary(self, engine: CrawlEngine) -> Dict[str, Any]:
+        stats = engine.summary()
+        summary = stats["http"]
+        logger.info(
+            f"Run summary: {summary['requests']} requests in {summary.get('wall_time', 0):.1f}s "
+            f"({summary.get('requests_per_second', 0):.2f} req/s), "
+            f"limiter rate {summary.get('current_rate')}, throttled {summary.get('throttled_responses')}, "
+            f"{stats['products']} unique products, dedup avoided {stats['duplicate_urls']} fetches, "
+            f"skipped {stats['duplicate_ids']} duplicate ids, {stats['retries']} retries, {stats['failed']} failed"
+        )
+        return stats
 
+
+class LeChocolatSite(SiteAdapter):
+    """Category pages carry an ld+json ItemList; a product listed in several categories is fetched once."""
+
+    name = "lechocolat"
+    # categories are merged from every category page before a product is written
+    hold_products = True
+    # categories only come from the category pages, so they are read even when the sitemap worked
+    listings_with_discovery = True
+
+    def __init__(self, scraper: ChocolateScraper):
+        self.scraper = scraper
+
+    def seeds(self):
+        for category_name, category_path in self.scraper.categories.items():
             print(f"Scraping category: {category_name}")
+            yield urljoin(self.scraper.base_url, category_path), {"category": category_name}
+
+    async def discover(self, engine: CrawlEngine):
+        if self.scraper.discovery != "sitemap":
+            return
+        # a product the category pages also list gets its categories through merge_duplicate
+        async for url, _ in iter_sitemap(engine.client, self.scraper.sitemap_url(),
+                                         include=self.scraper.is_product_url):
+            yield url, {"categories": []}
+
+    def parse_listing(self, url: str, html: str, meta: Dict[str, Any]) -> Listing:
+        selector = Selector(text=html)
+        product_data_str = selector.xpath("//script[@type='application/ld+json'][contains(text(), 'ItemList')]/text()").get()
+        if not product_data_str:
+            logger.warning(f"No ItemList found for category {meta['category']}")
+            return Listing()
+        return Listing(products=[
+            (d['url'], {"categories": [meta["category"]]})
+            for d in jsonlib.loads(product_data_str)["itemListElement"]
+        ])
+
+    def product_key(self, url: str, meta: Dict[str, Any]) -> str:
+        match = PRODUCT_ID_RE.search(urlsplit(url).path)
+        return f"id:{match.group(1)}" if match else self.scraper.normalize_url(url)
+
+    def merge_duplicate(self, meta: Dict[str, Any], duplicate: Dict[str, Any]):
+        for category in duplicate["categories"]:
+            if category not in meta["categories"]:
+                meta["categories"].append(category)
+
+    def finish_product(self, product: Dict[str, Any], request: CrawlRequest) -> Dict[str, Any]:
+        product['categories'] = list(request.meta["categories"])
+        return product
+
+    def parse_task(self, request: CrawlRequest):
+        return parse_product_html, (request.url,)
+
+_parser = None
+
+
+def parse_product_html(html: str, url: str):
+    """Module-level (picklable) entry point for ParseExecutor workers."""
+    global _parser
+    if _parser is None:
+        _parser = ChocolateScraper()
+    return _parser.parse_product(Selector(text=html), url)
 
-            results= await self.scrape_category(category_url)
-            all_products.extend(results)
-        return all_products
 
 def save_output(data):
     os.makedirs("output", exist_ok=True)
-    with open("output/chocolate_test.json", "w") as f:
-        json.dump(data, f, indent=4)
+    with open("output/chocolate_test.json", "wb") as f:
+        f.write(jsonlib.dumps_bytes(data, indent=4))
 
-async def main():
-    scraper = ChocolateScraper()
-    results = await scraper.scrape()
-    save_output(results)
+async def main(resume: bool = False, incremental: bool = False, parse_workers: int = 0,
+               parse_mode: str = "thread", columnar: Optional[str] = None,
+               concurrency: int = 8, discovery: str = "pages",
+               cache: Optional[str] = None, offline: bool = False, changes: bool = False,
+               status: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Full run into output/chocolate_test.*; returns the crawl summary. status["engine"] exposes live progress."""
+    checkpoint = CheckpointStore(site="lechocolat")
+    if not resume:
+        checkpoint.clear()
+    store = IncrementalStore(site="lechocolat") if incremental else None
+    parser = ParseExecutor(workers=parse_workers, mode=parse_mode)
+    response_cache = open_cache(cache, offline)
+    scraper = ChocolateScraper(max_in_flight=concurrency, checkpoint=checkpoint, incremental=store, parser=parser,
+                               discovery=discovery, cache=response_cache)
+    async with scraper.client:
+        exporter = ColumnarExporter(columnar, site="lechocolat") if columnar else None
+        index = PriceIndex(site="lechocolat", changes_path="output/chocolate_changes.ndjson") if changes else None
+        try:
+            with NDJSONWriter("output/chocolate_test.ndjson") as writer:
+                engine = scraper.engine(sinks=[writer] + [sink for sink in (exporter, index) if sink])
+                if status is not None:
+                    status["engine"] = engine
+                await engine.run()
+            summary = scraper.log_summary(engine)
+            if index:
+                index.finish(remove_missing=not resume and not summary["failed"] and not summary["sink_errors"])
+                logger.info(f"Price index: {index.summary()}")
+        finally:
+            # also when the crawl failed: a Parquet part is unreadable until its footer is written
+            if exporter:
+                exporter.close()
+            if index:
+                index.close()
+    parser.close()
+    ndjson_to_json("output/chocolate_test.ndjson", "output/chocolate_test.json", indent=4)
+    logger.info(f"Checkpoint: {checkpoint.summary()}")
+    checkpoint.close()
+    if store:
+        logger.info(f"Incremental: {store.summary()}")
+        store.close()
+    if response_cache:
+        logger.info(f"Response cache: {response_cache.summary()}")
+        response_cache.close()
     print("Scraping done")
+    return summary
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape lechocolat-alainducasse.com")
+    parser.add_argument("--resume", action="store_true", help="skip categories and products already in the checkpoint")
+    parser.add_argument("--incremental", action="store_true",
+                        help="send conditional requests and reuse last run's record for unchanged pages")
+    parser.add_argument("--parse-workers", type=int, default=0, help="parse in a worker pool (0 parses on the event loop)")
+    parser.add_argument("--parse-mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--columnar", metavar="DIR", help="also append products/models/variants Parquet tables under DIR")
+    parser.add_argument("--discovery", choices=["sitemap", "pages"], default="pages",
+                        help="categories only, or also every product in sitemap.xml (adds uncategorized products)")
+    parser.add_argument("--cache", metavar="DIR", help="keep responses in an on-disk cache under DIR (24h TTL)")
+    parser.add_argument("--offline", action="store_true", help="serve only from the response cache, never the network")
+    parser.add_argument("--changes", action="store_true",
+                        help="upsert into output/price_index.sqlite and write only new, removed and price-changed "
+                             "products to output/chocolate_changes.ndjson")
+    args = parser.parse_args()
+    asyncio.run(main(resume=args.resume, incremental=args.incremental,
+                     parse_workers=args.parse_workers, parse_mode=args.parse_mode,
+                     columnar=args.columnar, discovery=args.discovery,
+                     cache=args.cache, offline=args.offline, changes=args.changes))
\ No newline at end of file
@@ -0,0 +1,266 @@
+"""Run metrics: latency/size histograms and error counters, exported as Prometheus text or JSON.
+
+Everything records into the module-level METRICS registry:
+
+    with METRICS.timer("fetch_seconds", site="lechocolat", kind="product"):
+        ...
+    METRICS.observe("page_bytes", len(html), site="lechocolat", kind="product")
+    METRICS.inc("errors_total", site="lechocolat", kind="product", error="CrawlError")
+
+Parse functions run in a process pool record into that worker's registry,
+which is never merged back; the engine still times every parse job from
+the event loop side (parse_seconds).
+"""
+from typing import Dict, Any, Optional, Tuple, Iterable
+from contextlib import contextmanager
+import bisect
+import cProfile
+import functools
+import inspect
+import os
+import threading
+import time
+
+import jsonlib
+
+try:
+    import pyinstrument
+except ImportError:  # cProfile works without it
+    pyinstrument = None
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(9))  # 1KB .. 64MB
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """Cumulative-bucket histogram, the same shape Prometheus uses, plus min/max."""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Linear interpolation inside the bucket holding the q-th observation (like histogram_quantile)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return round(lower + (upper - lower) * (rank - seen) / count, 6)
+            seen += count
+        return self.max
+
+    def merge(self, other: Dict[str, Any]):
+        for i, count in enumerate(other["counts"]):
+            self.counts[i] += count
+        self.count += other["count"]
+        self.sum += other["sum"]
+        if other["count"]:
+            self.min = other["min"] if self.min is None else min(self.min, other["min"])
+            self.max = other["max"] if self.max is None else max(self.max, other["max"])
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"buckets": list(self.buckets), "counts": list(self.counts), "count": self.count,
+                "sum": self.sum, "min": self.min, "max": self.max}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """Registry of labelled histograms and counters. Safe to record into from parse threads."""
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.lock = threading.Lock()
+        self.enabled = True
+
+    def observe(self, name: str, value: float, buckets: Iterable[float] = None, **labels):
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                if buckets is None:
+                    buckets = BYTES_BUCKETS if name.endswith("_bytes") else LATENCY_BUCKETS
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels):
+        """Decorator version of timer() for plain and async functions."""
+        def decorate(fn):
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(name, **labels):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Picklable raw state, for merging a worker process's metrics into the parent."""
+        with self.lock:
+            return {
+                "histograms": [[name, list(labels), h.snapshot()] for (name, labels), h in self.histograms.items()],
+                "counters": [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+            }
+
+    def merge(self, snapshot: Dict[str, Any]):
+        with self.lock:
+            for name, labels, data in snapshot["histograms"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(data["buckets"])
+                self.histograms[key].merge(data)
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def summary(self) -> Dict[str, Any]:
+        """Stable, diffable JSON view: {name: {"site=x,kind=y": {...}}}."""
+        with self.lock:
+            histograms = {}
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                histograms.setdefault(name, {})[",".join(f"{k}={v}" for k, v in labels)] = histogram.summary()
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                counters.setdefault(name, {})[",".join(f"{k}={v}" for k, v in labels)] = value
+        return {"histograms": histograms, "counters": counters}
+
+    def to_prometheus(self, prefix: str = "scraper_") -> str:
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        typed = set()
+        for (name, labels), histogram in histograms:
+            metric = prefix + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_prom_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{metric}_sum{_prom_labels(labels)} {histogram.sum}")
+            lines.append(f"{metric}_count{_prom_labels(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            metric = prefix + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_prom_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """.json gets summary(), anything else (.prom, .txt) the Prometheus text format."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.endswith(".json"):
+            with open(path, "wb") as f:
+                f.write(jsonlib.dumps_bytes(self.summary(), indent=2))
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def profile(path: Optional[str], profiler: str = "cprofile"):
+    """Profile the enclosed block into path: a .prof file for cProfile, an HTML report for pyinstrument."""
+    if not path:
+        yield
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if profiler == "pyinstrument":
+        if pyinstrument is None:
+            raise RuntimeError("--profiler pyinstrument needs the 'pyinstrument' package")
+        # async_mode="enabled" follows awaits across the event loop instead of showing the loop idle
+        session = pyinstrument.Profiler(async_mode="enabled")
+        session.start()
+        try:
+            yield
+        finally:
+            session.stop()
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(session.output_html())
+        return
+    session = cProfile.Profile()
+    session.enable()
+    try:
+        yield
+    finally:
+        session.disable()
+        session.dump_stats(path)
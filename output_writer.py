@@ -0,0 +1,120 @@
+from typing import Dict, Any, Iterator, Optional
+import gzip
+import io
+import jsonlib
+from records import Product, RecordError
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd output is optional
+    zstandard = None
+
+
+def open_binary(path: str, mode: str, compression: Optional[str]):
+    if compression is None:
+        return open(path, mode)
+    if compression == "gzip":
+        return gzip.open(path, mode)
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd output needs the 'zstandard' package")
+        raw = open(path, mode)
+        if "w" in mode or "a" in mode:
+            return zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def guess_compression(path: str) -> Optional[str]:
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        return "zstd"
+    return None
+
+
+class NDJSONWriter:
+    """Writes one compact JSON product per line as soon as it is parsed.
+
+    Nothing is kept in memory, and lines are flushed (and fsynced) every
+    flush_every records so a crash only loses the last few products.
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = None, flush_every: int = 50,
+                 fsync: bool = True, append: bool = False, validate: bool = False):
+        self.path = path
+        self.compression = compression if compression is not None else guess_compression(path)
+        self.flush_every = flush_every
+        self.fsync = fsync
+        self.append = append
+        # check each product against records.Product before it is written
+        self.validate = validate
+        self.invalid = 0
+        self.count = 0
+        self.file = None
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.raw = open_binary(self.path, "ab" if self.append else "wb", self.compression)
+        self.file = io.TextIOWrapper(self.raw, encoding="utf-8")
+        return self
+
+    def write(self, product: Dict[str, Any]):
+        if self.validate:
+            try:
+                product = Product.from_dict(product).to_dict()
+            except RecordError as e:
+                self.invalid += 1
+                print(f"Skipping invalid product {product.get('id') if isinstance(product, dict) else product}: {e}")
+                return
+        self.file.write(jsonlib.dumps(product))
+        self.file.write("\n")
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        if self.compression == "gzip":
+            # push the pending deflate block to disk, the stream stays valid
+            self.raw.flush(zlib.Z_SYNC_FLUSH)
+        elif self.compression == "zstd":
+            self.raw.flush(zstandard.FLUSH_BLOCK)
+        if self.fsync and self.compression != "zstd":
+            os.fsync(self.raw.fileno())
+
+    def close(self):
+        if self.file:
+            self.file.flush()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_ndjson(path: str, compression: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    compression = compression if compression is not None else guess_compression(path)
+    with open_binary(path, "rb", compression) as raw:
+        for line in io.TextIOWrapper(raw, encoding="utf-8"):
+            line = line.strip()
+            if line:
+                yield jsonlib.loads(line)
+
+
+def ndjson_to_json(src: str, dst: str, indent: int = 2, compression: Optional[str] = None):
+    """Post-processing step: turn an NDJSON file into the old pretty JSON array, one record at a time."""
+    with open(dst, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i, product in enumerate(read_ndjson(src, compression)):
+            f.write(",\n" if i else "\n")
+            text = jsonlib.dumps(product, indent=indent)
+            f.write("\n".join(" " * indent + line for line in text.splitlines()))
+        f.write("\n]\n")
@@ -0,0 +1,49 @@
+from typing import Any, Callable, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+
+
+class ParseExecutor:
+    """Runs parse functions off the event loop so fetching keeps going while pages are parsed.
+
+    workers=0 parses inline on the loop (the old behaviour). "thread" mode
+    helps because lxml releases the GIL while parsing; "process" mode also
+    covers json.loads and the Python-level extraction, but parse functions
+    and their arguments must be picklable (module-level functions).
+
+    At most max_pending jobs are queued or running; once that many are in
+    flight, run() waits, which holds back the fetchers feeding it.
+    """
+
+    def __init__(self, workers: int = 0, mode: str = "thread", max_pending: Optional[int] = None):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown parse mode: {mode}")
+        self.workers = workers
+        self.mode = mode
+        self.max_pending = max_pending or max(workers, 1) * 4
+        self.pending = asyncio.Semaphore(self.max_pending)
+        self.pool = None
+        self.parsed = 0
+
+    def _get_pool(self):
+        if self.pool is None:
+            if self.mode == "process":
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parse")
+        return self.pool
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        if not self.workers:
+            self.parsed += 1
+            return fn(*args)
+        async with self.pending:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._get_pool(), fn, *args)
+            self.parsed += 1
+            return result
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
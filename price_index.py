@@ -0,0 +1,211 @@
+"""Cross-run price index: every run upserts into SQLite, only the differences are written out.
+
+    python price_index.py output/foreignfortune.json --site foreignfortune --changes output/foreignfortune_changes.ndjson
+
+Products are keyed on (site, id) and variants on (site, product id, variant
+id), using the ids the scrapers already extract. As a sink, each product is
+compared with what the index holds from earlier runs and a change line is
+emitted when it is new or any of price / sales_prices / prices moved:
+
+    {"change": "price_changed", "kind": "variant", "site": ..., "id": ..., "variant_id": ...,
+     "old": {"price": 25.0}, "new": {"price": 20.0}}
+
+finish() then reports products the run did not see as removed. Only call it
+with remove_missing=True for complete runs; a resumed or partly failed crawl,
+or one whose index writes failed, would otherwise drop everything it skipped.
+"""
+from typing import Dict, Any, List, Optional
+import argparse
+import os
+import sqlite3
+import time
+import uuid
+
+import jsonlib
+from output_writer import NDJSONWriter
+from records import parse_number
+
+
+def _prices(values) -> List[Optional[float]]:
+    return [parse_number(value) for value in values or []]
+
+
+class PriceIndex:
+    """Sink with the same write()/close() shape as output_writer.NDJSONWriter.
+
+    Every write() is its own transaction, so several sites (each with its own
+    PriceIndex, e.g. under run_all.py) can share one index file: no write
+    lock is held between products, and a write never waits on another site.
+    """
+
+    def __init__(self, path: str = "output/price_index.sqlite", site: str = "default",
+                 changes_path: Optional[str] = None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.site = site
+        self.run = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # a commit per product: WAL without an fsync on every one
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            "site TEXT, id TEXT, title TEXT, url TEXT, price REAL, sales_prices TEXT, prices TEXT, "
+            "first_seen REAL, last_seen REAL, run TEXT, PRIMARY KEY (site, id))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS variants ("
+            "site TEXT, product_id TEXT, variant_id TEXT, color TEXT, size TEXT, price REAL, "
+            "first_seen REAL, last_seen REAL, PRIMARY KEY (site, product_id, variant_id))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS products_run ON products (site, run)")
+        self.conn.commit()
+        self.changes = NDJSONWriter(changes_path).open() if changes_path else None
+        self.stats = {"seen": 0, "changes": 0, "new": 0, "price_changed": 0, "unchanged": 0, "removed": 0,
+                      "variants_new": 0, "variants_price_changed": 0, "variants_removed": 0}
+
+    def _emit(self, change: str, kind: str, product_id: str, **fields):
+        self.stats["changes"] += 1
+        if self.changes is not None:
+            self.changes.write({"change": change, "kind": kind, "site": self.site, "id": product_id, **fields})
+
+    def write(self, product: Dict[str, Any]):
+        if hasattr(product, "to_dict"):
+            product = product.to_dict()
+        product_id = str(product.get("id"))
+        current = {
+            "price": parse_number(product.get("price")),
+            "sales_prices": _prices(product.get("sales_prices")),
+            "prices": _prices(product.get("prices")),
+        }
+        variants = {}
+        for model in product.get("models") or []:
+            for variant in model.get("variants") or []:
+                if variant.get("id") is not None:
+                    variants[str(variant["id"])] = (model.get("color"), variant.get("size"),
+                                                    parse_number(variant.get("price")))
+
+        now = time.time()
+        row = self.conn.execute(
+            "SELECT price, sales_prices, prices, first_seen FROM products WHERE site = ? AND id = ?",
+            (self.site, product_id),
+        ).fetchone()
+        self.stats["seen"] += 1
+        if row is None:
+            self.stats["new"] += 1
+            self._emit("new", "product", product_id, url=product.get("url"), title=product.get("title"),
+                       **current, variants=[{"variant_id": variant_id, "color": color, "size": size, "price": price}
+                                            for variant_id, (color, size, price) in variants.items()])
+            first_seen = now
+        else:
+            previous = {"price": row[0], "sales_prices": jsonlib.loads(row[1]), "prices": jsonlib.loads(row[2])}
+            if previous != current:
+                self.stats["price_changed"] += 1
+                self._emit("price_changed", "product", product_id, url=product.get("url"),
+                           old=previous, new=current)
+            else:
+                self.stats["unchanged"] += 1
+            first_seen = row[3]
+            self._diff_variants(product_id, variants)
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO products (site, id, title, url, price, sales_prices, prices, first_seen, "
+            "last_seen, run) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.site, product_id, product.get("title"), product.get("url"), current["price"],
+             jsonlib.dumps(current["sales_prices"]), jsonlib.dumps(current["prices"]), first_seen, now, self.run),
+        )
+        self.conn.executemany(
+            "INSERT INTO variants (site, product_id, variant_id, color, size, price, first_seen, last_seen) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (site, product_id, variant_id) DO UPDATE SET "
+            "color = excluded.color, size = excluded.size, price = excluded.price, last_seen = excluded.last_seen",
+            [(self.site, product_id, variant_id, color, size, price, now, now)
+             for variant_id, (color, size, price) in variants.items()],
+        )
+        self.conn.commit()
+
+    def _diff_variants(self, product_id: str, variants: Dict[str, tuple]):
+        previous = dict(self.conn.execute(
+            "SELECT variant_id, price FROM variants WHERE site = ? AND product_id = ?", (self.site, product_id),
+        ).fetchall())
+        for variant_id, (color, size, price) in variants.items():
+            if variant_id not in previous:
+                self.stats["variants_new"] += 1
+                self._emit("new", "variant", product_id, variant_id=variant_id, color=color, size=size, price=price)
+            elif previous[variant_id] != price:
+                self.stats["variants_price_changed"] += 1
+                self._emit("price_changed", "variant", product_id, variant_id=variant_id,
+                           old={"price": previous[variant_id]}, new={"price": price})
+        gone = [variant_id for variant_id in previous if variant_id not in variants]
+        for variant_id in gone:
+            self.stats["variants_removed"] += 1
+            self._emit("removed", "variant", product_id, variant_id=variant_id)
+        self.conn.executemany(
+            "DELETE FROM variants WHERE site = ? AND product_id = ? AND variant_id = ?",
+            [(self.site, product_id, variant_id) for variant_id in gone],
+        )
+
+    def flush(self):
+        self.conn.commit()
+        if self.changes is not None:
+            self.changes.flush()
+
+    def finish(self, remove_missing: bool = True):
+        """End of run: products this run did not write are reported as removed and dropped from the index."""
+        # a run that produced nothing (site down, offline cache miss) says nothing about the catalog
+        if remove_missing and self.stats["seen"]:
+            gone = [row[0] for row in self.conn.execute(
+                "SELECT id FROM products WHERE site = ? AND run != ?", (self.site, self.run),
+            ).fetchall()]
+            for product_id in gone:
+                self.stats["removed"] += 1
+                self._emit("removed", "product", product_id)
+            self.conn.executemany("DELETE FROM products WHERE site = ? AND id = ?",
+                                  [(self.site, product_id) for product_id in gone])
+            self.conn.executemany("DELETE FROM variants WHERE site = ? AND product_id = ?",
+                                  [(self.site, product_id) for product_id in gone])
+        self.flush()
+
+    def summary(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+    def close(self):
+        self.conn.commit()
+        if self.changes is not None:
+            self.changes.close()
+            self.changes = None
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def index_file(src: str, site: str, path: str = "output/price_index.sqlite",
+               changes_path: Optional[str] = None, remove_missing: bool = True) -> Dict[str, Any]:
+    # validation configures logging on import, keep it out of scraper processes that only write
+    from validation import iter_products
+    with PriceIndex(path, site=site, changes_path=changes_path) as index:
+        for product in iter_products(src):
+            index.write(product)
+        index.finish(remove_missing=remove_missing)
+    return index.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("src", help="scraped JSON array or NDJSON file (one complete run)")
+    parser.add_argument("--site", required=True, help="site the products belong to, e.g. foreignfortune")
+    parser.add_argument("--index", default="output/price_index.sqlite")
+    parser.add_argument("--changes", metavar="PATH", help="write new/removed/price-changed lines as NDJSON to PATH")
+    parser.add_argument("--keep-missing", action="store_true",
+                        help="src is a partial run: don't report products missing from it as removed")
+    args = parser.parse_args()
+    summary = index_file(args.src, args.site, args.index, args.changes, remove_missing=not args.keep_missing)
+    print(f"Price index: {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from typing import Dict, Any
+import asyncio
+import time
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose refill rate follows the server.
+
+    The rate grows additively while responses are fast and healthy, and is cut
+    multiplicatively on 429/503 or when latency goes above the target.
+    """
+
+    def __init__(self, rate: float = 5.0, burst: int = 5, min_rate: float = 0.5,
+                 max_rate: float = 50.0, target_latency: float = 1.0,
+                 increase_step: float = 0.5, backoff_factor: float = 0.5):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.target_latency = target_latency
+        self.increase_step = increase_step
+        self.backoff_factor = backoff_factor
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.throttled = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def record(self, latency: float, status: int):
+        if status in (429, 503):
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+            # drop the saved-up burst as well, the server asked us to slow down now
+            self.tokens = min(self.tokens, 0)
+        elif latency > self.target_latency:
+            self.rate = max(self.min_rate, self.rate * (1 - (1 - self.backoff_factor) / 2))
+        else:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def summary(self) -> Dict[str, Any]:
+        return {"current_rate": round(self.rate, 2), "throttled_responses": self.throttled}
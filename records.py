@@ -0,0 +1,247 @@
+"""Typed, slotted product records.
+
+Scrapers build Product/Model/Variant records instead of nested dicts: no
+per-instance __dict__, and low-cardinality strings (brands, colors, sizes,
+availability, categories) are interned so thousands of variants share one
+copy. Records also behave as mutable mappings (product["id"],
+model.get("color"), product["categories"] = [...]), so code written
+against the scraped dicts keeps working, and the plain dict is only built
+by to_dict() when a record is written out.
+"""
+from typing import Dict, Any, List, Optional, Union, Iterator, Tuple
+from collections.abc import MutableMapping
+from dataclasses import dataclass, field
+import sys
+
+import jsonlib
+
+
+class RecordError(ValueError):
+    pass
+
+
+def parse_number(value) -> Optional[float]:
+    """Number from a scraped price: ints/floats as-is, strings like "$3.99" or "£1,000.00" stripped."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value.replace("$", "").replace("£", "").replace(",", "").strip())
+        except ValueError:
+            return None
+    return None
+
+
+def _number(value, name: str) -> float:
+    number = parse_number(value)
+    if number is None:
+        raise RecordError(f"{name} must be a number, got {value!r}")
+    return number
+
+
+# extra keys whose values repeat across a catalog
+INTERNED_EXTRA = ("availability", "categories")
+
+
+def intern(value):
+    """sys.intern for strings (and lists of strings), anything else unchanged."""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return [sys.intern(v) if isinstance(v, str) else v for v in value]
+    return value
+
+
+def _extra(data: Dict[str, Any], fields: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    return {k: v for k, v in data.items() if k not in fields} or None
+
+
+class RecordView(MutableMapping):
+    """Dict-style access to a slotted record: FIELDS are attributes, other keys go to extra.
+
+    extra stays None until a key is set on it, so the many variants and
+    models without site-specific keys don't each carry an empty dict.
+    """
+
+    __slots__ = ()
+    FIELDS: Tuple[str, ...] = ()
+
+    def _fields(self) -> Tuple[str, ...]:
+        return self.FIELDS
+
+    def __getitem__(self, key: str):
+        if key in self._fields():
+            return getattr(self, key)
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key: str, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+            return
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = intern(value) if key in INTERNED_EXTRA else value
+
+    def __delitem__(self, key: str):
+        if key in self.FIELDS:
+            raise KeyError(f"{key} is a record field and can't be removed")
+        if self.extra is None:
+            raise KeyError(key)
+        del self.extra[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._fields()
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return len(self._fields()) + (len(self.extra) if self.extra else 0)
+
+
+@dataclass(slots=True, eq=True)
+class Variant(RecordView):
+    """One size of a model, as ForeignFortuneScraper.extract_models builds them."""
+    id: Union[str, int]
+    image: Optional[str] = None
+    price: Any = None
+    size: Optional[str] = None
+    extra: Optional[Dict[str, Any]] = None
+
+    FIELDS = ("id", "image", "price", "size")
+
+    def __post_init__(self):
+        self.size = intern(self.size)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Variant":
+        return cls(id=data.get("id"), image=data.get("image"), price=data.get("price"), size=data.get("size"),
+                   extra=_extra(data, cls.FIELDS))
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"id": self.id, "image": self.image, "price": self.price, "size": self.size}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+@dataclass(slots=True, eq=True)
+class Model(RecordView):
+    """A color with its variants (Foreign Fortune), or a linked product (Le Chocolat: title/link in extra)."""
+    color: Optional[str] = None
+    variants: Optional[List[Variant]] = None
+    extra: Optional[Dict[str, Any]] = None
+
+    FIELDS = ("color", "variants")
+
+    def __post_init__(self):
+        self.color = intern(self.color)
+
+    def _fields(self) -> Tuple[str, ...]:
+        # linked-product models have neither key, keep them out of the view and the output
+        return self.FIELDS if self.variants is not None else ()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Model":
+        variants = data.get("variants")
+        return cls(
+            color=data.get("color"),
+            variants=[v if isinstance(v, Variant) else Variant.from_dict(v) for v in variants]
+            if variants is not None else None,
+            extra=_extra(data, cls.FIELDS),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {}
+        if self.variants is not None:
+            data["color"] = self.color
+            data["variants"] = [variant.to_dict() for variant in self.variants]
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+def _model(model) -> Union[Model, Any]:
+    return Model.from_dict(model) if isinstance(model, dict) else model
+
+
+@dataclass(slots=True, eq=True)
+class Product(RecordView):
+    """Typed product record. Site-specific keys (availability, categories, ...) live in extra."""
+    id: Union[str, int]
+    title: Optional[str]
+    url: str
+    price: float
+    image: Optional[str] = None
+    description: Optional[str] = None
+    sales_prices: List[float] = field(default_factory=list)
+    prices: List[float] = field(default_factory=list)
+    images: List[str] = field(default_factory=list)
+    brand: Optional[str] = None
+    models: List[Model] = field(default_factory=list)
+    extra: Optional[Dict[str, Any]] = None
+
+    FIELDS = ("id", "title", "image", "price", "description", "sales_prices", "prices",
+              "images", "url", "brand", "models")
+
+    def __post_init__(self):
+        self.brand = intern(self.brand)
+        if self.extra:
+            for key in INTERNED_EXTRA:
+                if key in self.extra:
+                    self.extra[key] = intern(self.extra[key])
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Product":
+        """Validate and coerce one scraped dict (or record) in a single pass."""
+        if isinstance(data, RecordView):
+            data = data.to_dict()
+        if not isinstance(data, dict):
+            raise RecordError(f"product must be an object, got {type(data).__name__}")
+        if data.get("id") in (None, ""):
+            raise RecordError("missing id")
+        url = data.get("url")
+        if not isinstance(url, str) or not url:
+            raise RecordError("missing url")
+        return cls(
+            id=data["id"],
+            title=data.get("title"),
+            url=url,
+            price=_number(data.get("price"), "price"),
+            image=data.get("image"),
+            description=data.get("description"),
+            sales_prices=[_number(p, "sales_prices") for p in data.get("sales_prices") or []],
+            prices=[_number(p, "prices") for p in data.get("prices") or []],
+            images=list(data.get("images") or []),
+            brand=data.get("brand"),
+            models=[_model(model) for model in data.get("models") or []],
+            extra=_extra(data, cls.FIELDS),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "id": self.id,
+            "title": self.title,
+            "image": self.image,
+            "price": self.price,
+            "description": self.description,
+            "sales_prices": self.sales_prices,
+            "prices": self.prices,
+            "images": self.images,
+            "url": self.url,
+            "brand": self.brand,
+            "models": [model.to_dict() if isinstance(model, RecordView) else model for model in self.models],
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def to_json(self) -> str:
+        return jsonlib.dumps(self.to_dict())
+
+
+def decode_products(data: Union[str, bytes]) -> List[Product]:
+    return [Product.from_dict(item) for item in jsonlib.loads(data)]
@@ -0,0 +1,138 @@
+from typing import Dict, Any, Iterable, Optional
+import asyncio
+import re
+
+DEFAULT_BLOCKED_TYPES = {'image', 'font', 'media', 'stylesheet'}
+DEFAULT_BLOCKED_PATTERNS = [
+    r'google-analytics\.com',
+    r'googletagmanager\.com',
+    r'doubleclick\.net',
+    r'facebook\.(net|com)/',
+    r'hotjar\.com',
+    r'newrelic\.com|nr-data\.net',
+    r'segment\.(io|com)',
+    r'optimizely\.com',
+    r'bing\.com/bat',
+]
+
+
+class ResourceBlocker:
+    """Aborts requests the parsers never look at, using pyppeteer request interception.
+
+    A request is blocked when its resource type or url matches the deny list,
+    unless its url matches the allow list. Counters are kept per page and
+    taken (and reset) after each navigation; a page's entry is dropped when
+    the page closes.
+
+    Aborted requests never reach the network, so their size is estimated: the
+    first calibration_pages tabs load their first page unblocked, and what
+    the blocked requests would have cost is taken from the average size of
+    each resource type on those pages.
+    """
+
+    def __init__(self, blocked_types: Optional[Iterable[str]] = None,
+                 blocked_patterns: Optional[Iterable[str]] = None,
+                 allowed_patterns: Optional[Iterable[str]] = None,
+                 calibration_pages: int = 1):
+        self.blocked_types = set(DEFAULT_BLOCKED_TYPES if blocked_types is None else blocked_types)
+        patterns = DEFAULT_BLOCKED_PATTERNS if blocked_patterns is None else blocked_patterns
+        self.blocked_patterns = [re.compile(p) for p in patterns]
+        self.allowed_patterns = [re.compile(p) for p in (allowed_patterns or [])]
+        self.page_stats = {}
+        self.totals = self._empty_stats()
+        self.calibrations_left = calibration_pages
+        self.calibrating = set()
+        # resource type -> [responses, bytes] of would-be-blocked requests seen while calibrating
+        self.samples = {}
+        # interception callbacks in flight: the loop only keeps weak references to tasks
+        self.tasks = set()
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {"allowed_requests": 0, "allowed_bytes": 0, "blocked_requests": 0, "blocked_bytes": 0,
+                "blocked_types": {}}
+
+    def should_block(self, url: str, resource_type: str) -> bool:
+        if any(p.search(url) for p in self.allowed_patterns):
+            return False
+        if resource_type in self.blocked_types:
+            return True
+        return any(p.search(url) for p in self.blocked_patterns)
+
+    async def attach(self, page):
+        self.page_stats[page] = self._empty_stats()
+        if self.calibrations_left > 0:
+            self.calibrations_left -= 1
+            self.calibrating.add(page)
+        await page.setRequestInterception(True)
+        page.on('request', lambda request: self._spawn(self._on_request(page, request)))
+        page.on('response', lambda response: self._on_response(page, response))
+        page.on('close', lambda: self.detach(page))
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def detach(self, page):
+        """Fold a closed (or recycled) page's last counters into the totals and forget the page."""
+        self.calibrating.discard(page)
+        if page in self.page_stats:
+            self._add_to_totals(self._finish(self.page_stats.pop(page)))
+
+    async def _on_request(self, page, request):
+        # a late event for a page that already closed is counted nowhere, rather than resurrecting its entry
+        stats = self.page_stats.get(page) or self._empty_stats()
+        try:
+            if self.should_block(request.url, request.resourceType) and page not in self.calibrating:
+                stats["blocked_requests"] += 1
+                types = stats["blocked_types"]
+                types[request.resourceType] = types.get(request.resourceType, 0) + 1
+                await request.abort()
+            else:
+                stats["allowed_requests"] += 1
+                await request.continue_()
+        except Exception as e:
+            # the request may already be handled if the page navigated away
+            print(f"Error intercepting {request.url}: {e}")
+
+    def _on_response(self, page, response):
+        stats = self.page_stats.get(page) or self._empty_stats()
+        length = response.headers.get('content-length')
+        if not (length and length.isdigit()):
+            return
+        stats["allowed_bytes"] += int(length)
+        if page in self.calibrating and response.request is not None:
+            resource_type = response.request.resourceType
+            if self.should_block(response.url, resource_type):
+                sample = self.samples.setdefault(resource_type, [0, 0])
+                sample[0] += 1
+                sample[1] += int(length)
+
+    def average_size(self, resource_type: str) -> float:
+        """Average bytes of a blocked request of this type, from the calibration pages (0 without samples)."""
+        responses, size = self.samples.get(resource_type) or (
+            sum(s[0] for s in self.samples.values()), sum(s[1] for s in self.samples.values()))
+        return size / responses if responses else 0.0
+
+    def _finish(self, stats: Dict[str, Any]) -> Dict[str, Any]:
+        stats["blocked_bytes"] = round(sum(count * self.average_size(resource_type)
+                                           for resource_type, count in stats["blocked_types"].items()))
+        return stats
+
+    def _add_to_totals(self, stats: Dict[str, Any]):
+        for key, value in stats.items():
+            if key == "blocked_types":
+                for resource_type, count in value.items():
+                    self.totals[key][resource_type] = self.totals[key].get(resource_type, 0) + count
+            else:
+                self.totals[key] += value
+
+    def take_stats(self, page) -> Dict[str, Any]:
+        stats = self._finish(self.page_stats.get(page) or self._empty_stats())
+        if page in self.page_stats:
+            self.page_stats[page] = self._empty_stats()
+        # a calibration tab blocks normally from its second navigation on
+        self.calibrating.discard(page)
+        self._add_to_totals(stats)
+        return stats
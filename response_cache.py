@@ -0,0 +1,210 @@
+"""Bounded on-disk response cache for development and replay runs.
+
+    cache = ResponseCache("output/http_cache", max_bytes=512 * 2**20, ttl=24 * 3600)
+    HttpClient(cache=cache)                 # aiohttp scrapers
+    TraderJoesScraper(cache=cache)          # rendered browser pages
+
+Bodies are stored once per content hash (two urls serving the same page
+share a file), compressed with zstd when the 'zstandard' package is there
+and zlib otherwise. A SQLite index maps each url to its body, status,
+headers, expiry and last access; once the stored bytes pass max_bytes the
+least recently used entries are evicted. offline=True serves only from the
+cache, ignoring expiry, so parsers can be iterated on without the network.
+"""
+from typing import Dict, Any, Optional
+from dataclasses import dataclass, field
+import hashlib
+import os
+import sqlite3
+import time
+import zlib
+
+import jsonlib
+
+try:
+    import zstandard
+except ImportError:  # zlib is the fallback codec
+    zstandard = None
+
+
+class CacheMiss(LookupError):
+    """Raised in offline mode for a url that is not in the cache."""
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    status: int
+    body: bytes
+    headers: Dict[str, str] = field(default_factory=dict)
+    stored_at: float = 0.0
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+
+class ResponseCache:
+    def __init__(self, path: str = "output/http_cache", max_bytes: int = 512 * 2 ** 20,
+                 ttl: Optional[float] = 24 * 3600, offline: bool = False, compression: str = None):
+        self.path = path
+        os.makedirs(os.path.join(path, "bodies"), exist_ok=True)
+        self.max_bytes = max_bytes
+        # seconds an entry is served for, checked on read; None keeps entries until they are evicted
+        self.ttl = ttl
+        self.offline = offline
+        self.compression = compression or ("zstd" if zstandard is not None else "zlib")
+        if self.compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstd cache compression needs the 'zstandard' package")
+        self.conn = sqlite3.connect(os.path.join(path, "index.sqlite"))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "namespace TEXT, url TEXT, status INTEGER, headers TEXT, body_hash TEXT, codec TEXT, "
+            "stored_at REAL, expires_at REAL, last_access REAL, PRIMARY KEY (namespace, url))"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS bodies (file TEXT PRIMARY KEY, size INTEGER)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+        self.conn.commit()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0}
+
+    def _body_path(self, body_hash: str, codec: str) -> str:
+        return os.path.join(self.path, "bodies", body_hash[:2], f"{body_hash}.{codec}")
+
+    def get(self, url: str, namespace: str = "http") -> Optional[CachedResponse]:
+        """The cached response, or None on a miss (CacheMiss instead when offline)."""
+        row = self.conn.execute(
+            "SELECT status, headers, body_hash, codec, stored_at, expires_at FROM entries "
+            "WHERE namespace = ? AND url = ?", (namespace, url),
+        ).fetchone()
+        now = time.time()
+        if row is not None and not self.offline:
+            # an explicit per-entry ttl wins, otherwise this cache's ttl decides
+            expires_at = row[5] if row[5] is not None else (row[4] + self.ttl if self.ttl is not None else None)
+            if expires_at is not None and expires_at <= now:
+                self.stats["expired"] += 1
+                row = None
+        body = None
+        if row is not None:
+            status, headers, body_hash, codec, stored_at, _ = row
+            try:
+                with open(self._body_path(body_hash, codec), "rb") as f:
+                    body = self._decompress(f.read(), codec)
+            except OSError:
+                # body file removed by hand or a crashed eviction; treat as a miss
+                body = None
+        if body is None:
+            self.stats["misses"] += 1
+            if self.offline:
+                raise CacheMiss(f"Not in the response cache (offline): {url}")
+            return None
+        self.conn.execute("UPDATE entries SET last_access = ? WHERE namespace = ? AND url = ?",
+                          (now, namespace, url))
+        self.conn.commit()
+        self.stats["hits"] += 1
+        return CachedResponse(url, status, body, jsonlib.loads(headers), stored_at)
+
+    def put(self, url: str, status: int, headers: Dict[str, str], body: bytes,
+            namespace: str = "http", ttl: Optional[float] = None):
+        # aiohttp and pyppeteer hand over multidicts with str subclasses for keys
+        headers = jsonlib.dumps({str(k): str(v) for k, v in headers.items()})
+        body_hash = hashlib.sha256(body).hexdigest()
+        codec = self.compression
+        body_path = self._body_path(body_hash, codec)
+        if not os.path.exists(body_path):
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            data = self._compress(body, codec)
+            # write then rename, so a reader never sees half a body
+            tmp_path = f"{body_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, body_path)
+            self.conn.execute("INSERT OR REPLACE INTO bodies (file, size) VALUES (?, ?)",
+                              (f"{body_hash}.{codec}", len(data)))
+        previous = self.conn.execute(
+            "SELECT body_hash, codec FROM entries WHERE namespace = ? AND url = ?", (namespace, url),
+        ).fetchone()
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries (namespace, url, status, headers, body_hash, codec, stored_at, "
+            "expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (namespace, url, status, headers, body_hash, codec, now,
+             now + ttl if ttl is not None else None, now),
+        )
+        # a url stored again with a new body leaves the old one behind unless another url serves it
+        if previous is not None and previous != (body_hash, codec):
+            self._drop_body(*previous)
+        self.conn.commit()
+        self.stats["stores"] += 1
+        self.evict()
+
+    def size(self) -> int:
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+
+    def evict(self):
+        """Drop least recently used entries (and bodies nobody else points at) until under max_bytes."""
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+        # bodies left behind by an older version of put() or a crash between the two tables
+        for (file,) in self.conn.execute(
+            "SELECT file FROM bodies WHERE NOT EXISTS (SELECT 1 FROM entries "
+            "WHERE entries.body_hash || '.' || entries.codec = bodies.file)"
+        ).fetchall():
+            body_hash, _, codec = file.rpartition(".")
+            total -= self._drop_body(body_hash, codec)
+        for namespace, url, body_hash, codec in self.conn.execute(
+            "SELECT namespace, url, body_hash, codec FROM entries ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM entries WHERE namespace = ? AND url = ?", (namespace, url))
+            self.stats["evictions"] += 1
+            total -= self._drop_body(body_hash, codec)
+        self.conn.commit()
+
+    def _drop_body(self, body_hash: str, codec: str) -> int:
+        """Remove a body no entry points at any more; returns the bytes freed (0 while still shared)."""
+        shared = self.conn.execute(
+            "SELECT 1 FROM entries WHERE body_hash = ? AND codec = ? LIMIT 1", (body_hash, codec)
+        ).fetchone()
+        if shared:
+            return 0
+        file = f"{body_hash}.{codec}"
+        row = self.conn.execute("SELECT size FROM bodies WHERE file = ?", (file,)).fetchone()
+        self.conn.execute("DELETE FROM bodies WHERE file = ?", (file,))
+        try:
+            os.remove(self._body_path(body_hash, codec))
+        except OSError:
+            pass
+        return row[0] if row else 0
+
+    def _compress(self, body: bytes, codec: str) -> bytes:
+        if codec == "zstd":
+            return zstandard.ZstdCompressor(level=6).compress(body)
+        return zlib.compress(body, 6)
+
+    def _decompress(self, data: bytes, codec: str) -> bytes:
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError("this cache holds zstd bodies, install the 'zstandard' package")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def summary(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["entries"] = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        stats["stored_bytes"] = self.size()
+        return stats
+
+    def close(self):
+        self.conn.close()
+
+
+def open_cache(path: Optional[str] = None, offline: bool = False) -> Optional[ResponseCache]:
+    """The cache behind the scrapers' --cache/--offline flags; offline alone uses the default directory."""
+    if not path and not offline:
+        return None
+    return ResponseCache(path or "output/http_cache", offline=offline)
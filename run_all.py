@@ -0,0 +1,223 @@
+"""Run any subset of the site scrapers at the same time from one entry point.
+
+    python run_all.py                                   # all three sites in one event loop
+    python run_all.py lechocolat foreignfortune --concurrency lechocolat=4
+    python run_all.py --process traderjoes --report output/run_report.json
+
+HTTP sites share this process's event loop; sites given with --process (the
+browser-heavy Trader Joe's, typically) run in their own worker process. The
+run takes about as long as the slowest site instead of the sum of all three.
+"""
+from typing import Dict, Any, List
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import importlib
+import multiprocessing
+import time
+
+import jsonlib
+from metrics import METRICS, profile
+
+# site name == module name, each module has an async main(**options) returning its crawl summary
+SITES = ("foreignfortune", "lechocolat", "traderjoes")
+HTTP_SITES = {"foreignfortune", "lechocolat"}
+
+
+def site_options(site: str, args, concurrency: Dict[str, int]) -> Dict[str, Any]:
+    options = {"resume": args.resume, "parse_workers": args.parse_workers, "parse_mode": args.parse_mode,
+               "cache": args.cache, "offline": args.offline, "changes": args.changes}
+    if site in HTTP_SITES:
+        options["incremental"] = args.incremental
+        options["columnar"] = args.columnar
+        if args.discovery:
+            options["discovery"] = args.discovery
+    if site == "foreignfortune":
+        options["product_source"] = args.product_source
+    if site == "traderjoes":
+        options["block_resources"] = args.block_resources
+        options["block_types"] = args.block_types
+        options["block_urls"] = args.block_urls
+        options["allow_urls"] = args.allow_urls
+        options["wait_for_selector"] = args.wait_for_selector
+        options["scroll_strategy"] = args.scroll_strategy
+        options["list_timeout_ms"] = args.list_timeout_ms
+    if site in concurrency:
+        options["concurrency"] = concurrency[site]
+    return options
+
+
+def _run_in_process(site: str, options: Dict[str, Any]):
+    module = importlib.import_module(site)
+    summary = asyncio.run(module.main(**options))
+    # the worker's histograms go back with the summary and are merged into the parent's registry
+    return summary, METRICS.snapshot()
+
+
+async def run_site(site: str, options: Dict[str, Any], status: Dict[str, Any],
+                   pool: ProcessPoolExecutor = None) -> Dict[str, Any]:
+    status["started_at"] = time.perf_counter()
+    try:
+        if pool is not None:
+            loop = asyncio.get_running_loop()
+            summary, snapshot = await loop.run_in_executor(pool, _run_in_process, site, options)
+            METRICS.merge(snapshot)
+        else:
+            module = importlib.import_module(site)
+            summary = await module.main(status=status, **options)
+        # the site mains log their own errors and return an empty summary when the crawl never ran
+        status["state"] = "done" if summary else "failed"
+        return summary or {}
+    except Exception as e:
+        status["state"] = f"failed: {e}"
+        return {}
+    finally:
+        status["wall_time"] = time.perf_counter() - status["started_at"]
+
+
+def progress_line(statuses: Dict[str, Dict[str, Any]], started_at: float) -> str:
+    parts = []
+    for site, status in statuses.items():
+        engine = status.get("engine")
+        if status["state"] != "running":
+            parts.append(f"{site}: {status['state']}")
+        elif engine is None:
+            parts.append(f"{site}: running{' (process)' if status.get('process') else ''}")
+        else:
+            progress = engine.progress()
+            parts.append(f"{site}: {progress['products']} products, {progress['listings']} listings, "
+                         f"{progress['failed']} failed, frontier {progress['frontier']}")
+    return f"[{time.perf_counter() - started_at:6.1f}s] " + " | ".join(parts)
+
+
+async def report_progress(statuses: Dict[str, Dict[str, Any]], started_at: float, every: float):
+    while True:
+        await asyncio.sleep(every)
+        print(progress_line(statuses, started_at))
+
+
+async def run(sites: List[str], args, concurrency: Dict[str, int]) -> Dict[str, Any]:
+    started_at = time.perf_counter()
+    process_sites = [site for site in sites if site in args.process]
+    # spawn, not fork: the parent already has a running event loop and open sockets
+    pool = ProcessPoolExecutor(max_workers=len(process_sites),
+                               mp_context=multiprocessing.get_context("spawn")) if process_sites else None
+    statuses = {site: {"state": "running", "process": site in process_sites} for site in sites}
+    reporter = asyncio.ensure_future(report_progress(statuses, started_at, args.progress_every))
+    try:
+        summaries = await asyncio.gather(*(
+            run_site(site, site_options(site, args, concurrency), statuses[site],
+                     pool if site in process_sites else None)
+            for site in sites
+        ))
+    finally:
+        reporter.cancel()
+        if pool is not None:
+            pool.shutdown()
+
+    report = {"wall_time": time.perf_counter() - started_at, "sites": {}}
+    for site, summary in zip(sites, summaries):
+        status = statuses[site]
+        report["sites"][site] = {
+            "state": status["state"],
+            "mode": "process" if status["process"] else "event loop",
+            "wall_time": status["wall_time"],
+            "products": summary.get("products", 0),
+            "failed": summary.get("failed", 0),
+            # page-level retries by the engine plus request-level ones by HttpClient's FetchPolicy
+            "retries": summary.get("retries", 0) + summary.get("http", {}).get("retries", 0),
+            "requests": summary.get("http", {}).get("requests"),
+            "summary": summary,
+        }
+    report["sum_of_site_wall_times"] = sum(site["wall_time"] for site in report["sites"].values())
+    report["products"] = sum(site["products"] for site in report["sites"].values())
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"{'site':<16}{'state':<12}{'mode':<12}{'products':>9}{'failed':>8}{'retries':>9}{'wall s':>9}{'prod/s':>9}")
+    for site, row in report["sites"].items():
+        rate = row["products"] / row["wall_time"] if row["wall_time"] else 0.0
+        print(f"{site:<16}{row['state'][:11]:<12}{row['mode']:<12}{row['products']:>9}{row['failed']:>8}"
+              f"{row['retries']:>9}{row['wall_time']:>9.1f}{rate:>9.2f}")
+    print(f"Total: {report['products']} products in {report['wall_time']:.1f}s "
+          f"(sites one after another: {report['sum_of_site_wall_times']:.1f}s)")
+
+
+def parse_concurrency(values: List[str]) -> Dict[str, int]:
+    budgets = {}
+    for value in values:
+        site, _, number = value.partition("=")
+        if site not in SITES or not number.isdigit():
+            raise argparse.ArgumentTypeError(f"expected SITE=N with SITE in {', '.join(SITES)}, got {value!r}")
+        budgets[site] = int(number)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sites", nargs="*", metavar="SITE", help=f"any of {', '.join(SITES)} (default: all)")
+    parser.add_argument("--concurrency", action="append", default=[], metavar="SITE=N",
+                        help="per-site worker budget, e.g. lechocolat=4 (repeatable)")
+    parser.add_argument("--process", action="append", default=[], choices=SITES,
+                        help="run this site in its own worker process (repeatable)")
+    parser.add_argument("--resume", action="store_true", help="skip pages and products already in the checkpoint")
+    parser.add_argument("--incremental", action="store_true",
+                        help="send conditional requests and reuse last run's record for unchanged pages")
+    parser.add_argument("--parse-workers", type=int, default=0, help="parse in a worker pool (0 parses on the event loop)")
+    parser.add_argument("--parse-mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--columnar", metavar="DIR", help="also append products/models/variants Parquet tables under DIR")
+    parser.add_argument("--discovery", choices=["sitemap", "pages"],
+                        help="HTTP sites: find products in sitemap.xml first, or only through listing pages "
+                             "(default: sitemap for Foreign Fortune, pages for Le Chocolat)")
+    parser.add_argument("--product-source", choices=["json", "page"], default="json",
+                        help="Foreign Fortune: build models from the product JSON (falls back to the page) or the full page")
+    parser.add_argument("--block-resources", action="store_true",
+                        help="Trader Joe's: abort images, fonts, media, stylesheets and analytics requests")
+    parser.add_argument("--block-type", action="append", metavar="TYPE", dest="block_types",
+                        help="Trader Joe's: resource type to block instead of the defaults (repeatable)")
+    parser.add_argument("--block-url", action="append", metavar="REGEX", dest="block_urls",
+                        help="Trader Joe's: url pattern to block instead of the default analytics hosts (repeatable)")
+    parser.add_argument("--allow-url", action="append", metavar="REGEX", dest="allow_urls",
+                        help="Trader Joe's: never block urls matching this pattern (repeatable)")
+    parser.add_argument("--wait-for-selector", action="store_true",
+                        help="Trader Joe's: wait for the content selector instead of networkidle0")
+    parser.add_argument("--scroll-strategy", choices=["poll", "observer"],
+                        help="Trader Joe's: settle listing pages by scrolling or until the item count stops changing")
+    parser.add_argument("--list-timeout-ms", type=int, default=10000,
+                        help="Trader Joe's: upper bound for settling one listing page")
+    parser.add_argument("--cache", metavar="DIR", help="keep responses and rendered pages in an on-disk cache under DIR")
+    parser.add_argument("--offline", action="store_true", help="serve only from the response cache, never the network")
+    parser.add_argument("--changes", action="store_true",
+                        help="upsert every site into output/price_index.sqlite and write only new, removed and "
+                             "price-changed products to a *_changes.ndjson next to each site's output")
+    parser.add_argument("--progress-every", type=float, default=10.0, metavar="SECONDS")
+    parser.add_argument("--report", metavar="PATH", help="write the combined metrics report as JSON")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write stage histograms and error counts: PATH.json as a summary, else Prometheus text")
+    parser.add_argument("--profile", metavar="PATH", help="profile this process (not --process sites) into PATH")
+    parser.add_argument("--profiler", choices=["cprofile", "pyinstrument"], default="cprofile")
+    args = parser.parse_args()
+
+    unknown = [site for site in args.sites if site not in SITES]
+    if unknown:
+        parser.error(f"unknown site(s): {', '.join(unknown)}")
+    try:
+        concurrency = parse_concurrency(args.concurrency)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    sites = list(dict.fromkeys(args.sites)) or list(SITES)
+
+    with profile(args.profile, args.profiler):
+        report = asyncio.run(run(sites, args, concurrency))
+    print_report(report)
+    if args.metrics:
+        METRICS.write(args.metrics)
+    if args.report:
+        report["metrics"] = METRICS.summary()
+        with open(args.report, "wb") as f:
+            f.write(jsonlib.dumps_bytes(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
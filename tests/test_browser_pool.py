@@ -0,0 +1,193 @@
+"""PagePool against a headless Chromium and a local static fixture site.
+
+The Chromium tests are skipped when no Chromium is available (set
+PYPPETEER_EXECUTABLE_PATH or run pyppeteer-install); the refill tests use a
+stand-in browser.
+"""
+import asyncio
+import os
+import shutil
+
+import pytest
+from aiohttp import web
+
+from browser_pool import PagePool
+
+FIXTURE_PAGE = """<!doctype html>
+<html><body>
+<ul class="ProductList_productList__list">
+  <li><a href="/home/products/pdp/one-1">One</a></li>
+  <li><a href="/home/products/pdp/two-2">Two</a></li>
+</ul>
+</body></html>
+"""
+
+
+def chromium_path():
+    path = os.environ.get("PYPPETEER_EXECUTABLE_PATH")
+    if path and os.path.exists(path):
+        return path
+    try:
+        from pyppeteer import chromium_downloader
+    except ImportError:
+        return None
+    if chromium_downloader.check_chromium():
+        return str(chromium_downloader.chromium_executable())
+    for name in ("chromium", "chromium-browser", "google-chrome"):
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+CHROMIUM = chromium_path()
+needs_chromium = pytest.mark.skipif(CHROMIUM is None, reason="needs a Chromium for pyppeteer")
+
+
+async def serve_fixture():
+    app = web.Application()
+    app.router.add_get("/", lambda request: web.Response(text=FIXTURE_PAGE, content_type="text/html"))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/"
+
+
+async def items(page, url):
+    await page.goto(url)
+    return await page.querySelectorAllEval(".ProductList_productList__list li", "nodes => nodes.length")
+
+
+def run_pool(check):
+    from pyppeteer import launch
+
+    async def main():
+        runner, url = await serve_fixture()
+        # autoClose=False: the browser is closed below, before asyncio.run tears the loop down
+        browser = await launch(executablePath=CHROMIUM, headless=True, autoClose=False,
+                               args=["--no-sandbox", "--disable-setuid-sandbox", "--disable-dev-shm-usage"])
+        pool = PagePool(browser, size=2)
+        try:
+            await pool.start()
+            await check(pool, url)
+        finally:
+            await pool.close()
+            await browser.close()
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+@needs_chromium
+def test_pages_load_concurrently():
+    async def check(pool, url):
+        async def load():
+            async with pool.page() as page:
+                return await items(page, url)
+
+        assert await asyncio.gather(*(load() for _ in range(6))) == [2] * 6
+        assert pool.queue.qsize() == 2
+        assert pool.recycled == 0
+
+    run_pool(check)
+
+
+@needs_chromium
+def test_closed_tab_is_recycled():
+    async def check(pool, url):
+        async with pool.page() as page:
+            await page.close()
+        assert pool.recycled == 1
+        assert pool.queue.qsize() == 2
+        for _ in range(2):
+            async with pool.page() as page:
+                assert not page.isClosed()
+                assert await items(page, url) == 2
+
+    run_pool(check)
+
+
+@needs_chromium
+def test_crashed_tab_is_recycled():
+    async def check(pool, url):
+        async with pool.page() as page:
+            crashed = page
+            # what pyppeteer emits when the renderer process dies
+            page.emit("error", Exception("Page crashed!"))
+        assert pool.recycled == 1
+        pages = [pool.queue.get_nowait() for _ in range(pool.queue.qsize())]
+        assert crashed not in pages
+        assert crashed.isClosed()
+        for page in pages:
+            pool.queue.put_nowait(page)
+        async with pool.page() as page:
+            assert await items(page, url) == 2
+
+    run_pool(check)
+
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+
+    def on(self, event, handler):
+        pass
+
+    def isClosed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+class FlakyBrowser:
+    """newPage fails `failures` times, then waits on `gate` (when set) before handing out a page."""
+
+    def __init__(self, failures=0, gate=None):
+        self.failures = failures
+        self.gate = gate
+
+    async def newPage(self):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("browser busy")
+        if self.gate is not None:
+            await self.gate.wait()
+        return FakePage()
+
+
+def test_failed_replacement_is_refilled_in_the_background():
+    async def main():
+        browser = FlakyBrowser()
+        pool = PagePool(browser, size=2)
+        await pool.start()
+        browser.failures = 1
+        async with pool.page() as page:
+            await page.close()
+        assert len(pool.tasks) == 1
+        await asyncio.gather(*pool.tasks)
+        assert pool.tasks == set()
+        assert pool.queue.qsize() == 2
+        await pool.close()
+
+    asyncio.run(main())
+
+
+def test_close_cancels_pending_refills():
+    async def main():
+        browser = FlakyBrowser()
+        pool = PagePool(browser, size=1)
+        await pool.start()
+        browser.failures = 1
+        browser.gate = asyncio.Event()
+        async with pool.page() as page:
+            await page.close()
+        (refill,) = pool.tasks
+        await asyncio.sleep(0)
+        await pool.close()
+        assert refill.cancelled()
+        assert pool.tasks == set()
+
+    asyncio.run(main())
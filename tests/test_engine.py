@@ -0,0 +1,77 @@
+"""CrawlEngine with an in-memory adapter: ordering, merging and held products."""
+import asyncio
+
+from engine import CrawlEngine, SiteAdapter, Listing, PRODUCT
+
+
+def parse_product(html):
+    return {"id": html}
+
+
+class CategorySite(SiteAdapter):
+    """Two category pages listing overlapping products; product pages are their id."""
+
+    name = "fixture"
+    http = False
+    hold_products = True
+
+    def __init__(self, slow=(), delay=0.0):
+        self.slow = set(slow)
+        self.delay = delay
+        self.fetched = []
+
+    def seeds(self):
+        yield "cat:a", {"category": "a"}
+        yield "cat:b", {"category": "b"}
+
+    async def fetch(self, engine, request):
+        if request.kind == PRODUCT:
+            if request.url in self.slow:
+                await asyncio.sleep(self.delay)
+            self.fetched.append(request.url)
+            return request.url
+        # let the products of the first category finish before the second one is read
+        await asyncio.sleep(0.05 if request.url == "cat:b" else 0)
+        return request.url
+
+    def parse_listing(self, url, html, meta):
+        products = {"cat:a": ["p1", "p2"], "cat:b": ["p2", "p3"]}[url]
+        return Listing([(product, {"categories": [meta["category"]]}) for product in products])
+
+    def parse_task(self, request):
+        return parse_product, ()
+
+    def merge_duplicate(self, meta, duplicate):
+        meta["categories"] += [c for c in duplicate["categories"] if c not in meta["categories"]]
+
+    def finish_product(self, product, request):
+        product["categories"] = list(request.meta["categories"])
+        return product
+
+
+def crawl(adapter, concurrency=4):
+    async def main():
+        engine = CrawlEngine(adapter, concurrency=concurrency)
+        products = []
+        async for product in engine.iter_products():
+            products.append((product, len(adapter.fetched)))
+        return products, engine
+
+    return asyncio.run(main())
+
+
+def test_products_come_out_in_discovery_order_with_merged_categories():
+    products, engine = crawl(CategorySite())
+    assert [(p["id"], p["categories"]) for p, _ in products] == [
+        ("p1", ["a"]), ("p2", ["a", "b"]), ("p3", ["b"])]
+    assert engine.stats["duplicate_urls"] == 1
+    assert engine.done == {}
+
+
+def test_held_products_are_released_once_the_listings_are_read():
+    # p3 is slow: p1 and p2 must not wait for the end of the crawl
+    products, engine = crawl(CategorySite(slow={"p3"}, delay=0.2))
+    released = {product["id"]: fetched for product, fetched in products}
+    assert released["p1"] < 3
+    assert released["p2"] < 3
+    assert engine.stats["products"] == 3
@@ -0,0 +1,206 @@
+"""HttpClient against a local aiohttp test server."""
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from fetch_policy import FetchPolicy, FetchError, CircuitOpenError
+from http_client import HttpClient
+
+
+def run_with_server(routes, check):
+    """Serve routes ({path: handler}) on a local port and run check(server) against it."""
+    async def main():
+        app = web.Application()
+        for path, handler in routes.items():
+            app.router.add_get(path, handler)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            return await check(server)
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+async def ok(request):
+    return web.Response(text="ok")
+
+
+def test_one_session_is_reused_across_requests():
+    async def check(server):
+        async with HttpClient() as client:
+            session = client.session
+            for _ in range(5):
+                result = await client.fetch(str(server.make_url("/")))
+                assert result.status == 200
+                assert result.text == "ok"
+                assert client.session is session
+            return client.summary()
+
+    stats = run_with_server({"/": ok}, check)
+    assert stats["requests"] == 5
+    assert stats["connections_created"] == 1
+    assert stats["connections_reused"] == 4
+    assert stats["request_time"] > 0
+    assert stats["connect_time"] > 0
+    assert stats["handshake_time_saved"] > 0
+
+
+def test_per_host_limit_is_respected():
+    active = {"now": 0, "peak": 0}
+
+    async def slow(request):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.05)
+        active["now"] -= 1
+        return web.Response(text="ok")
+
+    async def check(server):
+        async with HttpClient(limit_per_host=2) as client:
+            results = await asyncio.gather(*(client.fetch(str(server.make_url("/slow"))) for _ in range(8)))
+            assert [result.status for result in results] == [200] * 8
+            return client.summary()
+
+    stats = run_with_server({"/slow": slow}, check)
+    assert active["peak"] == 2
+    assert stats["connections_created"] == 2
+    assert stats["connections_reused"] == 6
+
+
+def failing(statuses, headers=None):
+    """Handler answering each status in turn, then 200 for good."""
+    statuses = list(statuses)
+
+    async def handler(request):
+        if statuses:
+            return web.Response(status=statuses.pop(0), headers=headers)
+        return web.Response(text="ok")
+
+    return handler
+
+
+def test_retryable_status_is_retried():
+    async def check(server):
+        async with HttpClient(policy=FetchPolicy(backoff=0.01)) as client:
+            result = await client.fetch(str(server.make_url("/")))
+            return result, client.summary()
+
+    result, stats = run_with_server({"/": failing([503, 502])}, check)
+    assert result.status == 200
+    assert stats["retries"] == 2
+    assert stats["requests"] == 3
+    assert stats["http_errors"] == 2
+
+
+def test_missing_page_is_not_retried():
+    async def check(server):
+        async with HttpClient(policy=FetchPolicy(backoff=0.01)) as client:
+            with pytest.raises(FetchError) as raised:
+                await client.fetch(str(server.make_url("/")))
+            assert raised.value.status == 404
+            assert not raised.value.retryable
+            return client.summary()
+
+    stats = run_with_server({"/": failing([404])}, check)
+    assert stats["retries"] == 0
+    assert stats["open_circuits"] == []
+
+
+def test_retry_after_is_honoured():
+    async def check(server):
+        async with HttpClient(policy=FetchPolicy(backoff=0.01)) as client:
+            started = time.monotonic()
+            result = await client.fetch(str(server.make_url("/")))
+            return result, time.monotonic() - started
+
+    result, elapsed = run_with_server({"/": failing([429], headers={"Retry-After": "1"})}, check)
+    assert result.status == 200
+    assert elapsed >= 1.0
+
+
+def test_circuit_opens_then_lets_a_trial_through():
+    async def check(server):
+        url = str(server.make_url("/"))
+        policy = FetchPolicy(max_attempts=1, failure_threshold=2, reset_timeout=0.2)
+        async with HttpClient(policy=policy) as client:
+            for _ in range(2):
+                with pytest.raises(FetchError):
+                    await client.fetch(url)
+            with pytest.raises(CircuitOpenError) as raised:
+                await client.fetch(url)
+            assert raised.value.retryable
+            assert 0 < raised.value.retry_in <= 0.2
+            requests = client.stats["requests"]
+            await asyncio.sleep(raised.value.retry_in)
+            result = await client.fetch(url)
+            assert result.status == 200
+            assert client.stats["requests"] == requests + 1
+            return client.summary()
+
+    stats = run_with_server({"/": failing([503, 503])}, check)
+    assert stats["circuit_rejections"] == 1
+    assert stats["circuits_opened"] == 1
+    assert stats["open_circuits"] == []
+
+
+def test_cancelled_trial_releases_the_circuit():
+    async def hang(request):
+        await asyncio.sleep(10)
+        return web.Response(text="ok")
+
+    async def check(server):
+        url = str(server.make_url("/"))
+        policy = FetchPolicy(max_attempts=1, failure_threshold=1, reset_timeout=0.05)
+        async with HttpClient(policy=policy) as client:
+            breaker = policy.breaker(server.make_url("/").raw_authority)
+            breaker.record_failure()
+            await asyncio.sleep(0.05)
+            trial = asyncio.ensure_future(client.fetch(url))
+            await asyncio.sleep(0.05)
+            assert breaker.trial_in_flight
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+            assert not breaker.trial_in_flight
+            assert breaker.state == "half-open"
+
+    run_with_server({"/": hang}, check)
+
+
+def test_body_not_matching_its_charset_still_decodes():
+    async def latin1(request):
+        return web.Response(body="café".encode("latin-1"), headers={"Content-Type": "text/html; charset=utf-8"})
+
+    async def check(server):
+        async with HttpClient() as client:
+            return await client.fetch(str(server.make_url("/")))
+
+    result = run_with_server({"/": latin1}, check)
+    assert result.text == "caf\ufffd"
+
+
+def test_total_timeout_covers_waiting_for_a_slot():
+    async def slow(request):
+        await asyncio.sleep(1)
+        return web.Response(text="ok")
+
+    async def check(server):
+        url = str(server.make_url("/"))
+        policy = FetchPolicy(total_timeout=0.2, max_attempts=1)
+        async with HttpClient(policy=policy, max_in_flight=1) as client:
+            started = time.monotonic()
+            results = await asyncio.gather(client.fetch(url), client.fetch(url), return_exceptions=True)
+            elapsed = time.monotonic() - started
+            assert all(isinstance(result, FetchError) for result in results)
+            return elapsed, client.summary()
+
+    elapsed, stats = run_with_server({"/": slow}, check)
+    assert elapsed < 0.5
+    assert stats["timeouts"] == 2
+    # only the attempt that got the slot went out, and it is counted although it timed out
+    assert stats["requests"] == 1
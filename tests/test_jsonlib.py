@@ -0,0 +1,46 @@
+"""Every JSON backend writes records the same way, wherever they sit in the data."""
+import pytest
+
+import jsonlib
+from records import Product, Model, Variant
+
+BACKENDS = ["json"] + [name for name, module in (("orjson", jsonlib.orjson), ("msgspec", jsonlib.msgspec)) if module]
+
+
+def product():
+    return Product(
+        id="12", title="Plaque noir", url="https://example.test/12-plaque.html", price=7.5,
+        sales_prices=[6.0], prices=[7.5], brand="Le Chocolat",
+        models=[
+            Model(color="Dark", variants=[Variant(id="12-1", price=7.5, size="100g"), Variant(id="12-2")]),
+            # a linked product: only extra keys
+            Model(extra={"title": "Plaque lait", "link": "https://example.test/13-lait.html"}),
+        ],
+        extra={"availability": "In stock", "categories": ["bars"]},
+    )
+
+
+SHAPES = {
+    "record": product,
+    "list": lambda: [product(), product()],
+    "nested": lambda: {"x": product(), "many": [{"y": product()}], "pair": (product(), 1)},
+    "bare model": lambda: Model(extra={"title": "Plaque lait"}),
+}
+
+
+@pytest.mark.parametrize("shape", sorted(SHAPES))
+@pytest.mark.parametrize("indent", [None, 2, 4])
+def test_backends_agree(shape, indent):
+    expected = jsonlib.dumps_bytes(SHAPES[shape](), indent=indent, backend="json")
+    for backend in BACKENDS:
+        data = jsonlib.dumps_bytes(SHAPES[shape](), indent=indent, backend=backend)
+        assert jsonlib.loads(data, backend="json") == jsonlib.loads(expected, backend="json"), backend
+        if indent is None:
+            assert data == expected, backend
+
+
+def test_records_are_written_through_to_dict():
+    data = jsonlib.loads(jsonlib.dumps_bytes({"x": product()}, backend=BACKENDS[-1]))
+    assert data["x"]["availability"] == "In stock"
+    assert "extra" not in data["x"]
+    assert data["x"]["models"][1] == {"title": "Plaque lait", "link": "https://example.test/13-lait.html"}
@@ -0,0 +1,95 @@
+"""ResourceBlocker with stand-in pyppeteer pages, requests and responses."""
+import asyncio
+
+from resource_blocker import ResourceBlocker
+
+
+class FakePage:
+    def __init__(self):
+        self.handlers = {}
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    def emit(self, event, *args):
+        self.handlers[event](*args)
+
+    async def setRequestInterception(self, enabled):
+        pass
+
+
+class FakeRequest:
+    def __init__(self, url, resource_type):
+        self.url = url
+        self.resourceType = resource_type
+        self.outcome = None
+
+    async def abort(self):
+        self.outcome = "aborted"
+
+    async def continue_(self):
+        self.outcome = "continued"
+
+
+class FakeResponse:
+    def __init__(self, request, size):
+        self.url = request.url
+        self.request = request
+        self.headers = {"content-length": str(size)}
+
+
+async def load(blocker, page, resources):
+    """One navigation: every (url, type, size) is requested, and answered unless aborted."""
+    requests = []
+    for url, resource_type, size in resources:
+        request = FakeRequest(url, resource_type)
+        page.emit("request", request)
+        requests.append((request, size))
+    await asyncio.gather(*blocker.tasks)
+    for request, size in requests:
+        if request.outcome == "continued":
+            page.emit("response", FakeResponse(request, size))
+    return blocker.take_stats(page)
+
+
+PAGE = [("https://example.test/", "document", 5000), ("https://example.test/a.png", "image", 1000),
+        ("https://example.test/b.png", "image", 3000), ("https://www.google-analytics.com/a.js", "script", 400)]
+
+
+def test_blocked_bytes_are_estimated_from_the_calibration_page():
+    async def main():
+        blocker = ResourceBlocker()
+        page = FakePage()
+        await blocker.attach(page)
+        first = await load(blocker, page, PAGE)
+        assert first["blocked_requests"] == 0
+        assert first["allowed_bytes"] == 9400
+        second = await load(blocker, page, PAGE)
+        assert second["allowed_requests"] == 1
+        assert second["allowed_bytes"] == 5000
+        assert second["blocked_requests"] == 3
+        assert second["blocked_types"] == {"image": 2, "script": 1}
+        assert second["blocked_bytes"] == 2 * 2000 + 400
+        assert blocker.totals["blocked_bytes"] == 4400
+
+    asyncio.run(main())
+
+
+def test_closed_page_is_forgotten():
+    async def main():
+        blocker = ResourceBlocker(calibration_pages=0)
+        page = FakePage()
+        await blocker.attach(page)
+        page.emit("request", FakeRequest("https://example.test/a.png", "image"))
+        await asyncio.gather(*blocker.tasks)
+        page.emit("close")
+        assert blocker.page_stats == {}
+        assert blocker.totals["blocked_requests"] == 1
+        # late events and a stats call after close don't bring the page back
+        page.emit("request", FakeRequest("https://example.test/b.png", "image"))
+        await asyncio.gather(*blocker.tasks)
+        blocker.take_stats(page)
+        assert blocker.page_stats == {}
+        assert blocker.tasks == set()
+
+    asyncio.run(main())
@@ -0,0 +1,44 @@
+"""ResponseCache storage bounds and body sharing."""
+import os
+
+from response_cache import ResponseCache
+
+
+def body_files(path):
+    return [name for _, _, names in os.walk(os.path.join(path, "bodies")) for name in names]
+
+
+def test_restoring_a_url_keeps_the_cache_bounded(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=5000, compression="zlib")
+    for i in range(50):
+        cache.put("http://example.test/page", 200, {}, os.urandom(80) + str(i).encode())
+        assert cache.size() <= cache.max_bytes
+    summary = cache.summary()
+    assert summary["entries"] == 1
+    assert summary["evictions"] == 0
+    assert len(body_files(str(tmp_path))) == 1
+    assert cache.get("http://example.test/page").body.endswith(b"49")
+    cache.close()
+
+
+def test_replaced_body_still_served_by_another_url_is_kept(tmp_path):
+    cache = ResponseCache(str(tmp_path), compression="zlib")
+    cache.put("http://example.test/a", 200, {}, b"shared")
+    cache.put("http://example.test/b", 200, {}, b"shared")
+    cache.put("http://example.test/a", 200, {}, b"changed")
+    assert cache.get("http://example.test/b").body == b"shared"
+    assert len(body_files(str(tmp_path))) == 2
+    cache.close()
+
+
+def test_evict_drops_orphan_bodies(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=5000, compression="zlib")
+    cache.put("http://example.test/a", 200, {}, b"old")
+    # an orphan as left behind before put() dropped replaced bodies
+    cache.conn.execute("DELETE FROM entries")
+    cache.conn.commit()
+    cache.max_bytes = 0
+    cache.evict()
+    assert cache.size() == 0
+    assert body_files(str(tmp_path)) == []
+    cache.close()
@@ -0,0 +1,47 @@
+"""ProductValidator checks and the bounded file-level report."""
+import json
+
+from validation import ProductValidator, validate_scraped_data
+
+
+def product(i, **fields):
+    data = {"id": str(i), "title": "Bar", "price": 5.0, "sales_prices": [4.0], "url": f"https://example.test/{i}"}
+    data.update(fields)
+    return data
+
+
+def test_errors_come_out_in_a_fixed_order():
+    products = [product(1, title="", url="ftp://example.test/1"), product(2, id=None, price="$x"),
+                product(3, sales_prices=["9.00"])]
+    errors = [(e.field, e.error, e.product_id) for e in ProductValidator().validate_batch(products)]
+    assert errors == [
+        ("id", "Missing required field: id", None),
+        ("title", "Missing required field: title", "1"),
+        ("price", "Invalid price format", None),
+        ("sales_price", "Sales price cannot be greater than original price", "3"),
+        ("url", "Invalid URL format", "1"),
+    ]
+
+
+def test_prices_are_parsed_from_strings():
+    errors = ProductValidator().validate_batch([product(1, price="£1,000.00", sales_prices=["$999"])])
+    assert errors == []
+
+
+def test_duplicates_only_with_seen_ids():
+    validator = ProductValidator()
+    assert validator.validate_product(product(1)) == []
+    assert validator.validate_product(product(1)) == []
+    seen = set()
+    assert validator.validate_batch([product(1), product(2)], seen) == []
+    errors = validator.validate_batch([product(2), product(3), product(3)], seen)
+    assert [(e.field, e.product_id) for e in errors] == [("id", "2"), ("id", "3")]
+
+
+def test_file_report_keeps_only_the_first_errors(tmp_path):
+    path = tmp_path / "products.ndjson"
+    with open(path, "w") as f:
+        for i in range(50):
+            f.write(json.dumps(product(i, title="")) + "\n")
+    errors = validate_scraped_data(str(path), batch_size=7, max_errors=10)
+    assert [e.product_id for e in errors] == [str(i) for i in range(10)]
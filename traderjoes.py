@@ -1,18 +1,93 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional
 from parsel import Selector
 from pyppeteer import launch
+from pyppeteer.errors import TimeoutError as PyppeteerTimeoutError
+import argparse
 import asyncio
-import json
+import jsonlib
 import os
-import re
-from urllib.parse import urljoin
+import time
+from browser_pool import PagePool
+from resource_blocker import ResourceBlocker
+from output_writer import NDJSONWriter, ndjson_to_json
+from price_index import PriceIndex
+from checkpoint import CheckpointStore
+from parse_executor import ParseExecutor
+from metrics import METRICS
+from records import Product
+from engine import CrawlEngine, CrawlRequest, CrawlError, SiteAdapter, Listing, LISTING
+from response_cache import ResponseCache, CacheMiss, open_cache
+from extraction import TJ_LIST_ITEMS, TJ_ITEM_URL, TJ_ITEM_IMAGE, TJ_ITEM_PRICE, TJ_ITEM_UNIT, first
+
+LISTING_LIST_SELECTOR = "ul[class^='ProductList_productList__list']"
+LISTING_SELECTOR = LISTING_LIST_SELECTOR + " > li"
+
+# Resolves with the final item count once the list stops growing for idleMs,
+# jumping straight to the bottom after every growth to trigger the next lazy load.
+WAIT_FOR_LIST_JS = '''
+    async (selector, idleMs, timeoutMs) => {
+        const list = document.querySelector(selector);
+        if (!list) return 0;
+        const count = () => list.children.length;
+        if (document.body.scrollHeight <= window.innerHeight) return count();
+        return await new Promise((resolve) => {
+            let last = count();
+            let idleTimer = null;
+            let deadline = null;
+            const observer = new MutationObserver(() => {
+                if (count() !== last) {
+                    last = count();
+                    window.scrollTo(0, document.body.scrollHeight);
+                    arm();
+                }
+            });
+            const finish = () => {
+                observer.disconnect();
+                clearTimeout(idleTimer);
+                clearTimeout(deadline);
+                resolve(count());
+            };
+            const arm = () => {
+                clearTimeout(idleTimer);
+                idleTimer = setTimeout(finish, idleMs);
+            };
+            observer.observe(list, {childList: true});
+            deadline = setTimeout(finish, timeoutMs);
+            window.scrollTo(0, document.body.scrollHeight);
+            arm();
+        });
+    }
+'''
+PRODUCT_SELECTOR = "h1[class^='ProductDetails_main__title']"
 
 class TraderJoesScraper:
     """ trader joes scrapper"""
-    def __init__(self):
+    def __init__(self, pool_size: int = 4, block_resources: bool = False,
+                 wait_for_selector: bool = False, blocker: ResourceBlocker = None,
+                 scroll_strategy: str = None, list_idle_ms: int = 500, list_timeout_ms: int = 10000,
+                 checkpoint: CheckpointStore = None, parser: ParseExecutor = None,
+                 replay=None, recorder=None, cache: ResponseCache = None):
         self.base_url = "https://www.traderjoes.com/home/products/category/products-2"
         self.browser = None
         self.page = None
+        self.pool_size = pool_size
+        self.pool = None
+        self.checkpoint = checkpoint
+        self.parser = parser or ParseExecutor()
+        # opt-in: abort images/fonts/media/analytics and wait for content selectors instead of networkidle0
+        self.blocker = blocker or (ResourceBlocker() if block_resources else None)
+        self.wait_for_selector = wait_for_selector
+        # offline runs: fixtures.BrowserReplay answers every request instead of the network
+        self.replay = replay
+        # fixtures.FixtureArchive that keeps the rendered html of every page
+        self.recorder = recorder
+        # rendered pages kept on disk; with a cache Chromium is only launched on the first miss
+        self.cache = cache
+        self.browser_lock = asyncio.Lock()
+        # how listing pages are settled before reading them: None, "poll" (auto_scroll) or "observer"
+        self.scroll_strategy = scroll_strategy
+        self.list_idle_ms = list_idle_ms
+        self.list_timeout_ms = list_timeout_ms
         
     async def init_browser(self):
         try:
@@ -26,9 +101,11 @@ class TraderJoesScraper:
                 ]
             )
             self.page = await self.browser.newPage()
-           
-            await self.page.setViewport({'width': 1920, 'height': 1080})
-            await self.page.setUserAgent('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+            await self.setup_page(self.page)
+
+            # the crawl engine renders listing and product pages in the pool, self.page is for one-off use
+            self.pool = PagePool(self.browser, size=self.pool_size, setup=self.setup_page)
+            await self.pool.start()
         
         except Exception as e:
             print(f"Browser initialization error: {e}")
@@ -36,25 +113,79 @@ class TraderJoesScraper:
                 await self.browser.close()
             raise
         
+    async def ensure_browser(self):
+        async with self.browser_lock:
+            if self.browser is None:
+                await self.init_browser()
+                if not self.browser or not self.page:
+                    raise Exception("Failed to initialize browser")
+
+    def cached_content(self, url: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        # rendered html differs from what a plain GET of the url returns, keep them apart
+        cached = self.cache.get(url, namespace="rendered")
+        return cached.text if cached else None
+
+    async def setup_page(self, page):
+        await page.setViewport({'width': 1920, 'height': 1080})
+        await page.setUserAgent('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+        if self.replay:
+            # replay owns request interception, nothing reaches the network to be blocked
+            await self.replay.attach(page)
+        elif self.blocker:
+            await self.blocker.attach(page)
+
     async def close_browser(self):
         if self.browser:
             await self.browser.close()
+            self.browser = None
             
-    async def get_page_content(self, url: str) -> str:
+    async def get_page_content(self, url: str, page=None, selector: str = None, settle_list: bool = False) -> str:
+        page = page or self.page
+        kind = "listing" if settle_list else "product"
         try:
-            response = await self.page.goto(
-                url, 
-                {'waitUntil': 'networkidle0', 'timeout': 30000}
-            )
+            start = time.perf_counter()
+            if self.wait_for_selector and selector:
+                wait = "selector"
+                response = await page.goto(url, {'waitUntil': 'domcontentloaded', 'timeout': 30000})
+                if response:
+                    try:
+                        await page.waitForSelector(selector, {'timeout': 30000})
+                    except PyppeteerTimeoutError:
+                        # e.g. the page after the last listing page, hand back what loaded
+                        print(f"Selector {selector} not found on {url}")
+                        METRICS.inc("errors_total", site="traderjoes", kind=kind, error="selector_timeout")
+            else:
+                wait = "networkidle0"
+                response = await page.goto(
+                    url, 
+                    {'waitUntil': 'networkidle0', 'timeout': 30000}
+                )
+            METRICS.observe("browser_load_seconds", time.perf_counter() - start, kind=kind, wait=wait)
             if not response:
                 print(f"Failed to get response for {url}")
                 return None
+
+            if settle_list:
+                with METRICS.timer("browser_settle_seconds", strategy=self.scroll_strategy or "none"):
+                    await self.settle_list(page)
                 
-            content = await self.page.content()
+            content = await page.content()
+            METRICS.observe("browser_content_bytes", len(content), kind=kind)
+            if self.recorder:
+                self.recorder.record(url, response.status, response.headers, content)
+            if self.cache is not None and response.status == 200:
+                self.cache.put(url, response.status, response.headers, content.encode("utf-8"), namespace="rendered")
+            if self.blocker:
+                stats = self.blocker.take_stats(page)
+                print(f"{url}: allowed {stats['allowed_requests']} requests / {stats['allowed_bytes']} bytes, "
+                      f"blocked {stats['blocked_requests']} requests / ~{stats['blocked_bytes']} bytes")
             return content
                 
         except Exception as e:
             print(f"Error getting page content for {url}: {e}")
+            METRICS.inc("errors_total", site="traderjoes", kind=kind, error=type(e).__name__)
             return None
              
     def clean_price(self, price_str: str) -> float:
@@ -63,9 +194,25 @@ class TraderJoesScraper:
         except (ValueError, AttributeError):
             return 0.0
         
-    async def auto_scroll(self):
+    async def settle_list(self, page=None):
+        if self.scroll_strategy == "poll":
+            await self.auto_scroll(page)
+        elif self.scroll_strategy == "observer":
+            await self.wait_for_list(page)
+
+    async def wait_for_list(self, page=None) -> int:
+        page = page or self.page
+        try:
+            return await page.evaluate(WAIT_FOR_LIST_JS, LISTING_LIST_SELECTOR,
+                                       self.list_idle_ms, self.list_timeout_ms)
+        except Exception as e:
+            print(f"Error waiting for product list: {e}")
+            return 0
+
+    async def auto_scroll(self, page=None):
+        page = page or self.page
         try:
-            await self.page.evaluate('''
+            await page.evaluate('''
                 async () => {
                     await new Promise((resolve) => {
                         let totalHeight = 0;
@@ -86,6 +233,7 @@ class TraderJoesScraper:
         except Exception as e:
             print(f"Error during scrolling: {e}")
             
+    @METRICS.timed("parse_product_seconds", site="traderjoes")
     def parse_product(self, selector: Selector, meta) -> Dict[str, Any]:
        
         try: 
@@ -97,20 +245,20 @@ class TraderJoesScraper:
 
             id = meta['url'].split("-")[-1]
 
-            product = {
-                "id": id,
-                "title": selector.xpath("//h1[@class='ProductDetails_main__title__14Cnm']/text()").get(),
-                "image": meta['image'],
-                "price":meta['price'],
-                "description": cleaned_description,
-                "ingredients section": cleaned_ingredients,
-                "sales_prices":[meta['price']],
-                "prices":[meta['price']],
-                "images": [meta["images"]],
-                "url": meta['url'],
-                "brand": meta['brand'],
-                "models": []
-            }
+            product = Product(
+                id=id,
+                title=selector.xpath("//h1[@class='ProductDetails_main__title__14Cnm']/text()").get(),
+                image=meta['image'],
+                price=meta['price'],
+                description=cleaned_description,
+                sales_prices=[meta['price']],
+                prices=[meta['price']],
+                images=[meta["images"]],
+                url=meta['url'],
+                brand=meta['brand'],
+                models=[],
+                extra={"ingredients section": cleaned_ingredients},
+            )
             
             
             
@@ -120,95 +268,204 @@ class TraderJoesScraper:
             print(f"Error parsing product: {e}")
             return {}
 
+    def listing_url(self, page: int) -> str:
+        return f"{self.base_url}?filters=%7B%22page%22%3A{page}%7D" if page > 1 else self.base_url
+
+    def listing_metas(self, content: str) -> List[Dict[str, Any]]:
+        selector = Selector(text=content)
+        metas = []
+        for element in TJ_LIST_ITEMS(selector.root):
+            try:
+                # compiled XPaths relative to the <li> node, no reserialize/reparse per card
+                url = first(TJ_ITEM_URL, element)
+                image = first(TJ_ITEM_IMAGE, element)
+                price = first(TJ_ITEM_PRICE, element)
+                unit = first(TJ_ITEM_UNIT, element)
+
+                if not all([url, image, price]):
+                    print(f"Skipping product due to missing required fields")
+                    continue
+
+                metas.append({
+                    "url": f"https://www.traderjoes.com{url}",
+                    "image": f"https://www.traderjoes.com{image}",
+                    "price": self.clean_price(price),
+                    "sales_prices": [price],
+                    "prices": [price],
+                    "images": f"https://www.traderjoes.com{image}",
+                    "brand": "TRADERJOES",
+                })
+
+            except Exception as e:
+                print(f"Error processing product: {e}")
+                continue
+        return metas
+
     async def scrape(self) -> List[Dict[str, Any]]:
-        try:
-            await self.init_browser()
-            if not self.browser or not self.page:
-                raise Exception("Failed to initialize browser")
-            products = []
-            page = 1
-            
-            while True:
-                url = f"{self.base_url}?filters=%7B%22page%22%3A{page}%7D" if page > 1 else self.base_url
-                print(f"Scraping page {page}: {url}")
-                
-                content = await self.get_page_content(url)
-                selector = Selector(text=content)
+        return [product async for product in self.iter_products()]
 
-                
-                product_list = selector.xpath("//ul[@class='ProductList_productList__list__3-dGs']/li").getall()
-                
-                if not product_list:
-                    print(f"No products found on page {page}. Stopping pagination.")
-                    break
-                
-                for element in product_list:
-                    sel = Selector(text=element)
-                    try:
-                        url = sel.xpath("//section/a/@href").get()
-                        image = sel.xpath("//section/a/div//source/@srcset").get()
-                        price = sel.xpath("//section/div/div[@class='ProductPrice_productPrice__1Rq1r ProductCard_card__productPrice__1W4Le']/div/span[@class='ProductPrice_productPrice__price__3-50j']/text()").get()
-                        unit = sel.xpath("//section/div/div[@class='ProductPrice_productPrice__1Rq1r ProductCard_card__productPrice__1W4Le']/div/span[@class='ProductPrice_productPrice__unit__2jvkA']/text()").get()
-                        
-                        if not all([url, image, price]):
-                            print(f"Skipping product due to missing required fields")
-                            continue
-                        
-                        meta_info = {
-                            "url": f"https://www.traderjoes.com{url}",
-                            "image": f"https://www.traderjoes.com{image}",
-                            "price": self.clean_price(price),
-                            "sales_prices": [price],
-                            "prices": [price],
-                            "images": f"https://www.traderjoes.com{image}",
-                            "brand": "TRADERJOES",
-                        }
-                        
-                        product_content = await self.get_page_content(meta_info['url'])
-                        product_selector = Selector(text=product_content)
-                        product = self.parse_product(product_selector, meta=meta_info)
-                        
-                        if product:
-                            products.append(product)
-                            print(f"Successfully scraped product: {meta_info['url']}")
-                        
-                    except Exception as e:
-                        print(f"Error processing product: {e}")
-                        continue
-                
-                print(f"Completed page {page}. Products so far: {len(products)}")
-                page += 1
-                
-                
-                
-            return products
-            
+    def engine(self, **options) -> CrawlEngine:
+        # every worker holds one pooled tab, so the pool size is the concurrency
+        return CrawlEngine(TraderJoesSite(self), concurrency=self.pool_size,
+                           checkpoint=self.checkpoint, parser=self.parser, **options)
+
+    async def iter_products(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yields products as they are parsed; what was yielded survives a later failure."""
+        engine = self.engine()
+        try:
+            async for product in engine.iter_products():
+                yield product
         except Exception as e:
             print(f"Error during scraping: {e}")
-            return []
-        
-        finally:
-            await self.close_browser()
+        print(f"Crawl stats: {engine.summary()}")
+
+
+class TraderJoesSite(SiteAdapter):
+    """Listing and product pages are rendered in pooled browser tabs instead of fetched over HTTP."""
+
+    name = "traderjoes"
+    http = False
+
+    def __init__(self, scraper: TraderJoesScraper):
+        self.scraper = scraper
+
+    async def open(self, engine: CrawlEngine):
+        if self.scraper.cache is None:
+            await self.scraper.ensure_browser()
+
+    async def close(self):
+        if self.scraper.blocker:
+            print(f"Resource blocking totals: {self.scraper.blocker.totals}")
+        await self.scraper.close_browser()
+
+    def seeds(self):
+        yield self.scraper.listing_url(1), {"page": 1}
+
+    async def fetch(self, engine: CrawlEngine, request: CrawlRequest) -> Optional[str]:
+        try:
+            content = self.scraper.cached_content(request.url)
+        except CacheMiss as e:
+            raise CrawlError(str(e), retryable=False)
+        if content is not None:
+            return content
+        await self.scraper.ensure_browser()
+        async with self.scraper.pool.page() as page:
+            if request.kind == LISTING:
+                return await self.scraper.get_page_content(request.url, page=page, selector=LISTING_SELECTOR,
+                                                           settle_list=True)
+            return await self.scraper.get_page_content(request.url, page=page, selector=PRODUCT_SELECTOR)
+
+    def parse_listing(self, url: str, html: str, meta: Dict[str, Any]) -> Listing:
+        page = meta["page"]
+        metas = self.scraper.listing_metas(html)
+        if not metas:
+            print(f"No products found on page {page}. Stopping pagination.")
+            return Listing()
+        print(f"Read listing page {page}: {len(metas)} products")
+        return Listing(
+            products=[(item["url"], item) for item in metas],
+            next_pages=[(self.scraper.listing_url(page + 1), {"page": page + 1})],
+        )
+
+    def parse_task(self, request: CrawlRequest):
+        return parse_product_html, (request.meta,)
+
+
+_parser = None
+
+
+def parse_product_html(html: str, meta) -> Dict[str, Any]:
+    """Module-level (picklable) entry point for ParseExecutor workers."""
+    global _parser
+    if _parser is None:
+        _parser = TraderJoesScraper()
+    return _parser.parse_product(Selector(text=html), meta=meta)
 
 
 def save_output(products: List[Dict[str, Any]]):
     """Save scraped data to JSON file"""
     os.makedirs("output", exist_ok=True)
-    with open("output/traderjoes.json", "w") as f:
-        json.dump(products, f, indent=2)
+    with open("output/traderjoes.json", "wb") as f:
+        f.write(jsonlib.dumps_bytes(products, indent=2))
 
-async def main():
+async def main(resume: bool = False, parse_workers: int = 0, parse_mode: str = "thread",
+               concurrency: int = 4, cache: Optional[str] = None, offline: bool = False,
+               changes: bool = False, block_resources: bool = False, block_types: Optional[List[str]] = None,
+               block_urls: Optional[List[str]] = None, allow_urls: Optional[List[str]] = None,
+               wait_for_selector: bool = False, scroll_strategy: Optional[str] = None,
+               list_timeout_ms: int = 10000, status: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Full run into output/traderjoes.*; returns the crawl summary. status["engine"] exposes live progress."""
+    tj_scraper = None
+    summary = {}
+    response_cache = open_cache(cache, offline)
+    checkpoint = CheckpointStore(site="traderjoes")
+    if not resume:
+        checkpoint.clear()
+    index = PriceIndex(site="traderjoes", changes_path="output/traderjoes_changes.ndjson") if changes else None
+    blocker = None
+    if block_resources or block_types or block_urls or allow_urls:
+        blocker = ResourceBlocker(blocked_types=block_types, blocked_patterns=block_urls, allowed_patterns=allow_urls)
     try:
-        tj_scraper = TraderJoesScraper()
-        products = await tj_scraper.scrape()
-        save_output(products)
-        print(f"Total products scraped: {len(products)}")
+        tj_scraper = TraderJoesScraper(pool_size=concurrency, checkpoint=checkpoint,
+                                       parser=ParseExecutor(workers=parse_workers, mode=parse_mode),
+                                       cache=response_cache, blocker=blocker, wait_for_selector=wait_for_selector,
+                                       scroll_strategy=scroll_strategy, list_timeout_ms=list_timeout_ms)
+        with NDJSONWriter("output/traderjoes.ndjson") as writer:
+            engine = tj_scraper.engine(sinks=[writer] + ([index] if index else []))
+            if status is not None:
+                status["engine"] = engine
+            await engine.run()
+        summary = engine.summary()
+        if index:
+            index.finish(remove_missing=not resume and not summary["failed"] and not summary["sink_errors"])
+            print(f"Price index: {index.summary()}")
+        ndjson_to_json("output/traderjoes.ndjson", "output/traderjoes.json")
+        print(f"Total products scraped: {writer.count}")
+        print(f"Crawl stats: {summary}")
         print("Output saved")
     except Exception as e:
         print(f"Main error: {e}")
     finally:
         if tj_scraper and tj_scraper.browser:
             await tj_scraper.close_browser()
+        if tj_scraper:
+            tj_scraper.parser.close()
+        print(f"Checkpoint: {checkpoint.summary()}")
+        checkpoint.close()
+        if index:
+            index.close()
+        if response_cache:
+            print(f"Response cache: {response_cache.summary()}")
+            response_cache.close()
+    return summary
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape traderjoes.com")
+    parser.add_argument("--resume", action="store_true", help="skip listing pages and products already in the checkpoint")
+    parser.add_argument("--parse-workers", type=int, default=0, help="parse in a worker pool (0 parses on the event loop)")
+    parser.add_argument("--parse-mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--cache", metavar="DIR", help="keep rendered pages in an on-disk cache under DIR (24h TTL)")
+    parser.add_argument("--offline", action="store_true", help="serve only from the cache, never launch the browser")
+    parser.add_argument("--changes", action="store_true",
+                        help="upsert into output/price_index.sqlite and write only new, removed and price-changed "
+                             "products to output/traderjoes_changes.ndjson")
+    parser.add_argument("--block-resources", action="store_true",
+                        help="abort images, fonts, media, stylesheets and analytics requests")
+    parser.add_argument("--block-type", action="append", metavar="TYPE", dest="block_types",
+                        help="resource type to block instead of the defaults, e.g. image (repeatable)")
+    parser.add_argument("--block-url", action="append", metavar="REGEX", dest="block_urls",
+                        help="url pattern to block instead of the default analytics hosts (repeatable)")
+    parser.add_argument("--allow-url", action="append", metavar="REGEX", dest="allow_urls",
+                        help="never block urls matching this pattern (repeatable)")
+    parser.add_argument("--wait-for-selector", action="store_true",
+                        help="wait for the product list / details selector instead of networkidle0")
+    parser.add_argument("--scroll-strategy", choices=["poll", "observer"],
+                        help="settle listing pages by scrolling (poll) or until the item count stops changing (observer)")
+    parser.add_argument("--list-timeout-ms", type=int, default=10000, help="upper bound for settling one listing page")
+    args = parser.parse_args()
+    asyncio.run(main(resume=args.resume, parse_workers=args.parse_workers, parse_mode=args.parse_mode,
+                     cache=args.cache, offline=args.offline, changes=args.changes,
+                     block_resources=args.block_resources, block_types=args.block_types,
+                     block_urls=args.block_urls, allow_urls=args.allow_urls,
+                     wait_for_selector=args.wait_for_selector,
+                     scroll_strategy=args.scroll_strategy, list_timeout_ms=args.list_timeout_ms))
\ No newline at end of file
@@ -1,13 +1,29 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Iterable
 from dataclasses import dataclass
-from decimal import Decimal
+from itertools import compress, repeat
+import codecs
+import operator
 import re
 import json
+import jsonlib
 import logging
+from output_writer import guess_compression, open_binary
+from records import parse_number
+
+try:
+    import numpy as np
+except ImportError:  # prices are then compared with a plain loop
+    np = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+URL_PATTERN = re.compile(r'https?://[^\s<>"]+|www\.[^\s<>"]+')
+CHUNK_SIZE = 1 << 20
+_DECODER = json.JSONDecoder()
+# price values that count as absent rather than malformed
+EMPTY = (None, '')
+
 @dataclass
 class ValidationError:
     field: str
@@ -15,79 +31,242 @@ class ValidationError:
     product_id: Optional[str] = None
 
 class ProductValidator:
+    """Checks products in columnar batches.
+
+    Each check pulls one column out of the batch and runs over it as a whole:
+    required fields and URLs through C-level maps with the precompiled rules,
+    duplicate ids as set operations, prices as one float array per batch
+    (NumPy when installed). Errors come out in a fixed order, check by check
+    and row by row. The validator itself keeps no state; pass the same
+    seen_ids set to every validate_batch call to catch duplicate ids across a
+    whole file.
+    """
     def __init__(self):
-        self.required_fields = {'id', 'title', 'price', 'url'}
-        
+        self.required_fields = ('id', 'title', 'price', 'url')
+
     def validate_products(self, products):
-        errors = []
-        for product in products:
-            errors.extend(self.validate_product(product))
-        return errors
-    
+        return self.validate_batch(list(products))
+
     def validate_product(self, product):
+        return self.validate_batch([product])
+
+    def validate_batch(self, products: List[Dict[str, Any]],
+                       seen_ids: Optional[set] = None) -> List[ValidationError]:
         errors = []
+        count = len(products)
+        # every column any check reads, each pulled out of the batch once
+        columns = {field: _column(products, field)
+                   for field in dict.fromkeys(self.required_fields + ('id', 'price', 'sales_prices', 'url'))}
+        ids = columns['id']
 
         # req. field check
         for field in self.required_fields:
-            if field not in product or not product[field]:
-                errors.append(ValidationError(
-                    field=field,
-                    error=f"Missing required field: {field}",
-                    product_id=product.get('id')
-                ))
+            column = columns[field]
+            errors.extend(
+                ValidationError(field=field, error=f"Missing required field: {field}", product_id=ids[i])
+                for i in _where(map(operator.not_, column), count)
+            )
 
+        # duplicate ids across the whole file
+        if seen_ids is not None:
+            errors.extend(
+                ValidationError(field='id', error="Duplicate product id", product_id=ids[i])
+                for i in _duplicates(ids, seen_ids)
+            )
 
-        # price
-        if 'price' in product and 'sales_pricees' in product:
-            try:
-                price = Decimal(str(product['price']))
-                sales_price = Decimal(str(product['sales_price'][0])) ##bcz in code, we r taking sales prices as a list thats y.
-                if sales_price > price:
-                    errors.append(ValidationError(
-                        field='sales_price',
-                        error="Sales price cannot be greater than original price",
-                        product_id=product.get('id')
-                    ))
-            except (ValueError, TypeError):
-                errors.append(ValidationError(
-                    field='price',
-                    error="Invalid price format",
-                    product_id=product.get('id')
-                ))
-
-
-
-        # forurl
-        if 'url' in product:
-            url_pattern = r'https?://[^\s<>"]+|www\.[^\s<>"]+'
-            if not re.match(url_pattern, product['url']):
-                errors.append(ValidationError(
-                    field='url',
-                    error="Invalid URL format",
-                    product_id=product.get('id')
-                ))
+        errors.extend(self._check_prices(columns, ids))
+
+        # forurl: None is already reported as missing, anything else has to match
+        urls = columns['url']
+        invalid = map(operator.and_, map(operator.is_not, urls, repeat(None)),
+                      map(operator.not_, map(URL_PATTERN.match, _texts(urls))))
+        errors.extend(
+            ValidationError(field='url', error="Invalid URL format", product_id=ids[i])
+            for i in _where(invalid, count)
+        )
 
         return errors
 
-def validate_scraped_data(file_path):
+    def _check_prices(self, columns, ids) -> List[ValidationError]:
+        # price column, plus the first sales price (sales_prices is a list in every scraper)
+        price_col, invalid_prices = _numbers(columns['price'])
+        sales_col, invalid_sales = _numbers(list(map(_first, columns['sales_prices'])))
+        invalid = sorted(set(invalid_prices) | set(invalid_sales))
+
+        if np is not None:
+            with np.errstate(invalid='ignore'):
+                too_high = np.flatnonzero(sales_col > price_col).tolist()
+        else:
+            too_high = [
+                i for i, (p, s) in enumerate(zip(price_col, sales_col))
+                if p is not None and s is not None and s > p
+            ]
+
+        errors = [
+            ValidationError(field='price', error="Invalid price format", product_id=ids[i])
+            for i in invalid
+        ]
+        errors.extend(
+            ValidationError(
+                field='sales_price',
+                error="Sales price cannot be greater than original price",
+                product_id=ids[i]
+            )
+            for i in too_high
+        )
+        return errors
+
+
+def _column(products: List[Dict[str, Any]], field: str) -> List[Any]:
+    return [product.get(field) for product in products]
+
+
+def _where(flags: Iterable[bool], count: int) -> List[int]:
+    """Row numbers whose flag is set."""
+    return list(compress(range(count), flags))
+
+
+def _text(value) -> str:
+    return value if isinstance(value, str) else ''
+
+
+def _texts(values: List[Any]) -> Iterable[str]:
+    # scraped urls are strings; only a column with something else in it needs the per-value fallback
+    if all(map(isinstance, values, repeat(str))):
+        return values
+    return map(_text, values)
+
+
+def _first(values):
+    return values[0] if values else None
+
+
+def _numbers(values: List[Any]):
+    """Float column (NaN, or None without NumPy, where empty) and the rows that aren't numbers."""
+    if np is not None:
+        try:
+            # the common case, every value already a number (or None): one conversion, no parsing
+            if not any(map(isinstance, values, repeat((str, bool)))):
+                return np.array(values, dtype=float), []
+        except (TypeError, ValueError):
+            pass
+    numbers = list(map(parse_number, values))
+    invalid = _where(map(operator.and_, map(operator.is_, numbers, repeat(None)),
+                         map(operator.not_, map(EMPTY.__contains__, values))), len(values))
+    if np is not None:
+        numbers = np.array(numbers, dtype=float)
+    return numbers, invalid
+
+
+def _duplicates(ids: List[Any], seen_ids: set) -> List[int]:
+    """Rows whose id was seen before, in an earlier batch or earlier in this one; adds the new ids."""
+    rows = _where(map(operator.not_, map(EMPTY.__contains__, ids)), len(ids))
+    keys = list(map(str, map(ids.__getitem__, rows)))
+    earlier = seen_ids.intersection(keys)
+    unique = set(keys)
+    seen_ids.update(unique)
+    if not earlier and len(unique) == len(keys):
+        return []
+    # first row of every key in the batch: later rows with the same key are duplicates
+    first = dict(zip(reversed(keys), reversed(range(len(keys)))))
+    flags = map(operator.or_, map(earlier.__contains__, keys), map(operator.ne, map(first.__getitem__, keys),
+                                                                   range(len(keys))))
+    return list(compress(rows, flags))
+
+
+def iter_products(file_path: str) -> Iterator[Dict[str, Any]]:
+    """Stream products out of a JSON array or an NDJSON file (optionally .gz/.zst) without loading it whole."""
+    with open_binary(file_path, "rb", guess_compression(file_path)) as raw:
+        utf8 = codecs.getincrementaldecoder("utf-8-sig")()
+
+        def read() -> Optional[str]:
+            chunk = raw.read(CHUNK_SIZE)
+            return utf8.decode(chunk, final=not chunk) if chunk else None
+
+        buffer = (read() or "").lstrip()
+        if not buffer.startswith('['):
+            # NDJSON: one product per line
+            while buffer is not None:
+                lines = buffer.split("\n")
+                buffer = lines.pop()
+                for line in lines:
+                    if line.strip():
+                        yield jsonlib.loads(line)
+                chunk = read()
+                if chunk is None:
+                    break
+                buffer += chunk
+            if buffer.strip():
+                yield jsonlib.loads(buffer)
+            return
+
+        # JSON array: decode one element at a time with raw_decode, refilling the buffer as needed
+        pos = 1
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                product, end = _DECODER.raw_decode(buffer, pos)
+            except ValueError:
+                if eof:
+                    raise
+                chunk = read()
+                eof = chunk is None
+                buffer = buffer[pos:] + (chunk or "")
+                pos = 0
+                continue
+            yield product
+            pos = end
+            if pos > CHUNK_SIZE:
+                buffer = buffer[pos:]
+                pos = 0
+
+
+def _batches(products: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for product in products:
+        batch.append(product)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def validate_scraped_data(file_path, batch_size: int = 10000, log_limit: int = 100,
+                          max_errors: int = 10000) -> List[ValidationError]:
+    """Validate a whole file batch by batch. Every error is counted and logged in the
+    summary line, but only the first max_errors are kept, so a systematic defect
+    in a million-record file doesn't hold a million ValidationErrors."""
     try:
-        with open(file_path, 'r') as f:
-            products = json.load(f)
-        
         validator = ProductValidator()
-        errors = validator.validate_products(products)
-        
-        if errors:
-            logger.error(f"Found {len(errors)} validation errors")
-            for error in errors:
+        seen_ids = set()
+        errors = []
+        error_count = 0
+        total = 0
+        for batch in _batches(iter_products(file_path), batch_size):
+            total += len(batch)
+            batch_errors = validator.validate_batch(batch, seen_ids)
+            error_count += len(batch_errors)
+            errors.extend(batch_errors[:max_errors - len(errors)])
+
+        if error_count:
+            logger.error(f"Found {error_count} validation errors in {total} products")
+            for error in errors[:log_limit]:
                 logger.error(f"Product {error.product_id} - {error.field}: {error.error}")
-        
+            if error_count > log_limit:
+                logger.error(f"... {error_count - min(log_limit, len(errors))} more"
+                             + (f", only the first {len(errors)} are kept" if error_count > len(errors) else ""))
+
         return errors
-        
+
     except Exception as e:
         logger.error(f"Error validating file {file_path}: {str(e)}")
         raise
 
 if __name__ == "__main__":
     errors = validate_scraped_data("output/foreignfortune.json")
-    print(f"Total validation errors: {len(errors)}")
\ No newline at end of file
+    print(f"Validation errors kept: {len(errors)}")